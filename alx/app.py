@@ -8,13 +8,22 @@
 import configparser
 import os
 import sys
-import argparse
-from cryptography.fernet import Fernet
-import json
 import logging
 import platform
-from logging.handlers import TimedRotatingFileHandler
+import threading
+import time
 from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Union, get_args, get_origin, get_type_hints
+import types
+from alx.trace import TRACER, Tracer
+
+# `argparse`, `json`, `logging.handlers` and `cryptography` are imported
+# where they are used.  Action scripts start a new interpreter for every
+# alert so import time matters.
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator
+    from cryptography.fernet import MultiFernet
+    from alx.watch import ConfigWatcher
 
 
 class Paths:
@@ -66,6 +75,9 @@ class Paths:
         self.global_config = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), "alx.ini")
         """The path to the module configuration: `<venv>/lib/.../site-packages/alx/alx.ini`"""
+        self.cache = os.path.join(self.module_config_dir, "cache")
+        """The location of cached data such as configuration snapshots:
+        `~/.config/alx/cache`"""
 
         self.config = os.path.join(self.etc, appname + ".ini")
         """The name of the config file determined from `self.etc/app.ini`"""
@@ -99,6 +111,7 @@ class Paths:
                     f.write("[%s]\n\n" % s)
 
         if not os.path.isfile(self.keyfile):
+            from cryptography.fernet import Fernet
             print("*** NOTE: Creating key file '{}'".format(self.keyfile))
             # Create an initial fernet key.  User to adjust as required
             with open(self.keyfile, 'w') as f:
@@ -117,12 +130,550 @@ class Paths:
         return "\n".join(f"{k}: {v}" for k, v in vars(self).items() if isinstance(v, str))
 
 
+_key_cache = {}
+_key_lock = threading.Lock()
+
+
+def _reset_key_lock() -> None:
+    # The lock may have been held by another thread when the process forked
+    global _key_lock
+    _key_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_key_lock)
+
+
+def _read_keyfile(keyfile: str) -> "MultiFernet":
+    """
+    Read the keys in `keyfile`, one per line, into a `MultiFernet`.  The
+    result is cached until the modification time or size of the file
+    changes; the permissions are checked every time.  The process exits
+    if the file is missing, too open or empty as for `ALXapp.decrypt`
+
+    :param keyfile: The key file, usually `Paths.keyfile`
+    :return: The keys
+    """
+    try:
+        st = os.stat(keyfile)
+    except OSError:
+        ALXapp.logger.error("Could not open %s", keyfile)
+        sys.exit(1)
+
+    # Checked on every call as chmod does not change the signature
+    if platform.system() != 'Windows' and int(oct(st.st_mode)[3:]) > 600:
+        # Apologies to Windows users but your security is too messy
+        ALXapp.logger.error("Check permissions on %s.  Too open", keyfile)
+        sys.exit(1)
+
+    signature = (st.st_mtime_ns, st.st_size)
+    with _key_lock:
+        cached = _key_cache.get(keyfile)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    from cryptography.fernet import Fernet, MultiFernet
+
+    with open(keyfile) as k:
+        keys = [line.strip() for line in k
+                if line.strip() and not line.lstrip().startswith('#')]
+    if not keys:
+        ALXapp.logger.error("No keys found in %s", keyfile)
+        sys.exit(1)
+
+    fernet = MultiFernet([Fernet(key) for key in keys])
+    with _key_lock:
+        _key_cache[keyfile] = (signature, fernet)
+
+    return fernet
+
+
+class Secret:
+    PREFIX = "enc:"
+    """Configuration values starting with this prefix are encrypted"""
+    __slots__ = ('token', '_paths', '_value')
+
+    def __init__(self, token: str, paths: Paths = None) -> None:
+        """
+        An encrypted configuration value that is only decrypted when it is
+        first used.  The result is kept so it is decrypted once only.
+
+        :param token: The encrypted value without the `enc:` prefix
+        :param paths: The `Paths` holding the `keyfile`. Default is
+         `LibConfig.paths`
+        """
+        self.token = token
+        """The encrypted value"""
+        self._paths = paths
+        self._value = None
+
+    @property
+    def value(self) -> str:
+        """The decrypted value"""
+        if self._value is None:
+            paths = self._paths or LibConfig.paths()
+            self._value = _read_keyfile(paths.keyfile).decrypt(
+                self.token.encode()).decode()
+        return self._value
+
+    def __str__(self) -> str:
+        return self.value
+
+    def __repr__(self) -> str:
+        return "Secret('****')"
+
+    def __getstate__(self) -> tuple:
+        # Never pickle the decrypted value
+        return self.token, self._paths
+
+    def __setstate__(self, state: tuple) -> None:
+        self.token, self._paths = state
+        self._value = None
+
+
+class ConfigSchema:
+    _compiled = {}
+    _lock = threading.Lock()
+
+    def __init__(self, schema: Union[type, dict], name: str = "Section") -> None:
+        """
+        A declared layout for a configuration section.  The schema is
+        compiled once into a converter per key so loading a section does
+        not need to guess the type of each value as `ALXapp.parse_config`
+        does.  Values that cannot be converted are reported when the
+        section is loaded rather than when they are first used.
+
+        The schema can be a dataclass, ideally declared with `slots=True`:
+        ```
+        @dataclass(slots=True)
+        class Settings:
+            threshold: int
+            ratio: float = 0.5
+            hosts: list = field(default_factory=list)
+            output: str = "output.txt"
+        ```
+        or a mapping of key to type or `(type, default)`. A slotted
+        dataclass is generated for a mapping:
+        ```
+        {"threshold": int, "ratio": (float, 0.5), "hosts": list}
+        ```
+        Supported types are `str`, `int`, `float`, `bool`, `list` and
+        `dict` (parsed with `json.loads`), `Optional[...]` where an empty
+        value is `None`, and any other callable taking a string such as
+        `pathlib.Path`.  `$data` is expanded as in `ALXapp.parse_config`.
+
+        :param schema: A dataclass or a mapping of key to type
+        :param name: The class name generated for a mapping
+        """
+        import copy
+        import dataclasses
+
+        if isinstance(schema, dict):
+            fields = []
+            for key, spec in schema.items():
+                if isinstance(spec, tuple) and type(spec[1]).__hash__ is None:
+                    # A mutable default such as a list is copied for each
+                    # instance, as dataclasses requires
+                    fields.append((key, spec[0], dataclasses.field(
+                        default_factory=lambda d=spec[1]: copy.deepcopy(d))))
+                elif isinstance(spec, tuple):
+                    fields.append((key, spec[0], dataclasses.field(default=spec[1])))
+                else:
+                    fields.append((key, spec))
+            # Fields without defaults must come first
+            fields.sort(key=lambda f: len(f) == 3)
+            schema = dataclasses.make_dataclass(name, fields, slots=True)
+        elif not dataclasses.is_dataclass(schema):
+            raise TypeError("schema must be a dataclass or a mapping, not %r"
+                            % (schema,))
+
+        self.cls = schema
+        """The class instantiated by `load`"""
+        hints = get_type_hints(schema)
+        self._fields = []
+        for f in dataclasses.fields(schema):
+            if not f.init:
+                continue
+            required = (f.default is dataclasses.MISSING and
+                        f.default_factory is dataclasses.MISSING)
+            self._fields.append((f.name, self._converter(hints.get(f.name, str)),
+                                 required))
+
+    @classmethod
+    def compile(cls, schema: Union[type, dict]) -> "ConfigSchema":
+        """
+        Return the compiled `ConfigSchema` for `schema`, compiling a
+        dataclass or a mapping only once per process
+
+        :param schema: A dataclass, a mapping or an existing `ConfigSchema`
+        :return: The compiled schema
+        """
+        if isinstance(schema, ConfigSchema):
+            return schema
+        key = schema
+        if isinstance(schema, dict):
+            key = tuple(schema.items())
+            try:
+                hash(key)
+            except TypeError:
+                # Mutable defaults; the types and values identify the schema
+                key = repr(key)
+        with cls._lock:
+            compiled = cls._compiled.get(key)
+            if compiled is None:
+                compiled = cls._compiled[key] = cls(schema)
+            return compiled
+
+    @classmethod
+    def _converter(cls, tp: Any):
+        origin = get_origin(tp)
+        args = get_args(tp)
+        if origin in (Union, types.UnionType) and type(None) in args:
+            inner = [a for a in args if a is not type(None)]
+            convert = cls._converter(inner[0]) if len(inner) == 1 else str
+            return lambda v: None if v == '' else convert(v)
+        if origin is not None:
+            tp = origin
+        if tp is bool:
+            return cls._to_bool
+        if tp in (list, dict, tuple):
+            return lambda v: cls._to_json(v, tp)
+        if tp in (str, Any):
+            return str
+        return tp
+
+    @staticmethod
+    def _to_bool(value: str) -> bool:
+        try:
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+        except KeyError:
+            raise ValueError("not a boolean: %r" % value)
+
+    @staticmethod
+    def _to_json(value: str, tp: type):
+        import json
+
+        try:
+            result = json.loads(value, object_pairs_hook=OrderedDict)
+        except json.JSONDecodeError as e:
+            raise ValueError("invalid json: %s" % e)
+        if tp is tuple and isinstance(result, list):
+            return tuple(result)
+        if not isinstance(result, tp):
+            raise ValueError("expected %s, got %s" % (tp.__name__,
+                                                      type(result).__name__))
+        return result
+
+    def load(self, config: configparser.SectionProxy, paths: "Paths" = None) -> object:
+        """
+        Convert the values in `config` to a new instance of the schema.
+        Keys in the section that are not in the schema are ignored.
+
+        :param config: The section to load, for example
+         `app.config[app.environment]`.  `None` loads the defaults
+        :param paths: If set, `$data` in values is replaced by `paths.data`
+        :return: An instance of the schema class
+        :raises ValueError: If a required key is missing or a value
+         cannot be converted to its declared type
+        """
+        section = config.name if config is not None else "DEFAULT"
+        kwargs = {}
+        for key, convert, required in self._fields:
+            value = config.get(key) if config is not None else None
+            if value is None:
+                if required:
+                    raise ValueError("[%s] %s: missing required value"
+                                     % (section, key))
+                continue
+            if paths is not None and '$data' in value:
+                value = value.replace('$data', paths.data)
+            try:
+                kwargs[key] = convert(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError("[%s] %s: %s" % (section, key, e)) from None
+
+        return self.cls(**kwargs)
+
+
+class LibConfig:
+    """
+    A process-wide cache of the library configuration read from `alx.ini`
+    and `~/.config/alx/alx.ini`.  `ALXapp.read_lib_config` is called by
+    `ALXapp`, `alx.html.ALXhtml`, `alx.mail.ALXmail` and
+    `alx.itrs.alert.HtmlAlert` and they all share the one
+    `configparser.ConfigParser` rather than each reading the files again.
+
+    The configuration should be treated as read only.  Call `reload` if the
+    files have changed and the new values are needed.
+    """
+    _lock = threading.Lock()
+    _configs = {}
+    _paths = None
+
+    @classmethod
+    def paths(cls) -> Paths:
+        """
+        :return: A shared `Paths` for objects that are not an `ALXapp`
+        """
+        with cls._lock:
+            if cls._paths is None:
+                cls._paths = Paths("alx-common")
+            return cls._paths
+
+    @classmethod
+    def get(cls, paths: Paths) -> configparser.ConfigParser:
+        """
+        Return the library configuration, reading it on first use. The
+        user configuration files are created if they do not exist.
+
+        :param paths: The `Paths` holding `global_config` and `local_config`
+        :return: The merged `configparser.ConfigParser` configuration
+        """
+        key = (paths.global_config, paths.local_config)
+        with cls._lock:
+            config = cls._configs.get(key)
+            if config is None:
+                paths.create_configuration_files()
+                config = ALXapp.read_config(paths.global_config,
+                                            paths.local_config)
+                cls._configs[key] = config
+            return config
+
+    @classmethod
+    def seed(cls, paths: Paths,
+             config: configparser.ConfigParser) -> configparser.ConfigParser:
+        """
+        Share a configuration already read, for example from a
+        `ConfigSnapshot`, so `get` does not read the files.  A configuration
+        already cached for `paths` is kept.
+
+        :param paths: The `Paths` holding `global_config` and `local_config`
+        :param config: The library configuration
+        :return: The shared configuration
+        """
+        key = (paths.global_config, paths.local_config)
+        with cls._lock:
+            return cls._configs.setdefault(key, config)
+
+    @classmethod
+    def reload(cls, paths: Paths = None) -> configparser.ConfigParser:
+        """
+        Discard the cached configuration and read it again.  Objects that
+        already hold a reference keep the previous configuration.
+
+        :param paths: The `Paths` to reload.  Default is the shared `paths`
+        :return: The new configuration
+        """
+        cls.invalidate()
+        return cls.get(paths or cls.paths())
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """
+        Discard all cached configurations so the next `get` reads the files
+        """
+        with cls._lock:
+            cls._configs.clear()
+
+
+class ConfigSnapshot:
+    VERSION = 1
+    """Incremented when the layout of the snapshot changes"""
+
+    def __init__(self, paths: Paths, environment: str) -> None:
+        """
+        An on-disk cache of the merged and typed configuration of an
+        application.  The snapshot is keyed by the path, modification
+        time and size of the application ini file, `alx.ini` and
+        `~/.config/alx/alx.ini` so that any edit to those files causes
+        the configuration to be read and parsed again.
+
+        The snapshot is stored in `Paths.cache` and is a `pickle` of the
+        `configparser` objects and the values produced by
+        `ALXapp.parse_config`.
+
+        :param paths: The `Paths` of the application
+        :param environment: The runtime environment.  Values are parsed
+         from the matching section so it forms part of the key
+        """
+        self.filename = os.path.join(
+            paths.cache, "%s.%s.snapshot" % (os.path.basename(paths.config),
+                                             environment))
+        """The file holding the snapshot"""
+        self._paths = paths
+        self._environment = environment
+        self.key = self._make_key()
+        """The key identifying the configuration files used to build the
+        snapshot"""
+
+    def _make_key(self) -> tuple:
+        return (self.VERSION, self._environment, self._paths.data,
+                self._stat(self._paths.config),
+                self._stat(self._paths.global_config),
+                self._stat(self._paths.local_config))
+
+    @staticmethod
+    def _stat(filename: str) -> tuple:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return filename, None, None
+        return filename, st.st_mtime_ns, st.st_size
+
+    def load(self) -> dict:
+        """
+        Load the snapshot if it exists and matches the current
+        configuration files
+
+        :return: The stored values or `None` if there is no valid snapshot
+        """
+        import pickle
+
+        try:
+            with open(self.filename, 'rb') as f:
+                key, data = pickle.load(f)
+        except Exception:
+            # Missing, truncated or written by an incompatible version
+            return None
+
+        if key != self.key:
+            return None
+
+        return data
+
+    def save(self, data: dict) -> None:
+        """
+        Write the snapshot.  The file is written to a temporary name and
+        renamed so concurrent readers never see a partial snapshot.
+        Failure to save is not fatal.
+
+        Files that did not exist when the snapshot was loaded, such as the
+        user configuration created on first use, are stat'ed again.  If an
+        existing file changed while it was being read, nothing is saved.
+
+        :param data: The values to store
+        """
+        import pickle
+
+        key = self._make_key()
+        for old, new in zip(self.key, key):
+            if old != new and not (isinstance(old, tuple) and old[1] is None):
+                return
+        self.key = key
+
+        tmp = "%s.%d" % (self.filename, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                pickle.dump((self.key, data), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.filename)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class StartupProfiler:
+    ENVIRONMENT = "ALX_PROFILE_STARTUP"
+    """Set to `1` to time the phases of `ALXapp` start up or to `cprofile`
+    to also run `cProfile`"""
+    OPTION = "--profile-startup"
+    """The command line option to time the phases of `ALXapp` start up"""
+
+    def __init__(self) -> None:
+        """
+        Records how long each phase of `ALXapp.__init__` takes.  It is
+        enabled with `--profile-startup` on the command line or the
+        `ALX_PROFILE_STARTUP` environment variable.  When disabled,
+        `mark` does nothing.
+
+        The timings are written by `write` to
+        `Paths.log/<app>.startup.json` and, if `ALX_PROFILE_STARTUP=cprofile`,
+        the `cProfile` statistics to `Paths.log/<app>.startup.prof`. Use
+        `python -m pstats` or `snakeviz` to view the latter.
+        """
+        mode = os.environ.get(self.ENVIRONMENT, '').strip().lower()
+        self.enabled = mode not in ('', '0', 'false', 'no', 'off')
+        """Whether phases are being recorded"""
+        if self.OPTION in sys.argv[1:]:
+            self.enabled = True
+        self.phases = []
+        """A list of `(phase, seconds)`"""
+        self._profile = None
+        self._start = self._last = time.perf_counter()
+        if self.enabled and mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def enable(self) -> None:
+        """
+        Start recording from now, for when the option was only found once
+        the arguments were parsed
+        """
+        if not self.enabled:
+            self.enabled = True
+            self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """
+        Record the time since the previous mark against `phase`
+
+        :param phase: The name of the phase that has just finished
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self._last))
+            self._last = now
+
+    def write(self, name: str, paths: Paths) -> str:
+        """
+        Write the phase timings as JSON and, if enabled, the `cProfile`
+        statistics
+
+        :param name: The application name used for the file names
+        :param paths: The `Paths` of the application
+        :return: The JSON file written or `None` if not enabled
+        """
+        if not self.enabled:
+            return None
+        import json
+
+        total = time.perf_counter() - self._start
+        os.makedirs(paths.log, exist_ok=True)
+        result = {
+            "app": name,
+            "pid": os.getpid(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "total": total,
+            "phases": [{"phase": p, "seconds": t} for p, t in self.phases],
+        }
+        if self._profile:
+            self._profile.disable()
+            result["cprofile"] = os.path.join(paths.log, name + ".startup.prof")
+            self._profile.dump_stats(result["cprofile"])
+
+        filename = os.path.join(paths.log, name + ".startup.json")
+        with open(filename, 'w') as f:
+            json.dump(result, f, indent=2)
+
+        return filename
+
+
 class ALXapp:
     logger = logging.getLogger(os.path.splitext(os.path.basename(sys.argv[0]))[0])
     """The default logger used by all applications using `ALXapp`"""
+    log_listener = None
+    """The `alx.log_util.BlockingQueueListener` writing records to the
+    log handlers when `[logging] mode` is `queue`"""
+    _log_handlers = []
+    _log_signature = None
+
     def __init__(self, description: str = "Unknown App",
                  args: list = None, appname: str = None,
-                 inifile: str = None, epilog: str = None):
+                 inifile: str = None, epilog: str = None,
+                 cache_config: bool = False):
         """
         Initialise the `ALXapp` object which does a number of things:
         * Creates the application name from `sys.argv[0]` and stores it in
@@ -133,6 +684,10 @@ class ALXapp:
         * Reads and parses the configuration file and stores the values in the ALXAppp object
         * Reads and parses the library configuration stored in `alx.ini`
         * Initialises and starts logging to `Paths.logfile`
+        * If `--profile-startup` is passed or `ALX_PROFILE_STARTUP` is set,
+        writes the time taken by each of these steps with `StartupProfiler`
+        * If `--trace` is passed or `ALX_TRACE` is set, records the spans
+        started with `span` to `Paths.log/<app>.trace.json`
 
         An example `alx.ini` or `$HOME/config/alx/alx.ini` or
         `%APPDATA%\alx` on Windows
@@ -202,19 +757,31 @@ class ALXapp:
          is to create it from appname
         :param epilog: The text to use at the end of the help
          message when the app is called with `--help`
+        :param cache_config: If True, the merged and typed configuration
+         is kept in a `ConfigSnapshot` and reused on the next start until
+         one of the configuration files changes
         """
 
+        profiler = StartupProfiler()
+
         self.name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
         """The name of the application from the parameter or calculated from `sys.argv`"""
         if appname:
             self.name = appname
 
+        import argparse
         parser = argparse.ArgumentParser(description=description,
                                          epilog=epilog,
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
         parser.add_argument("-e", "--env", default='dev',
                             help="Runtime Environment, dev, test or prod")
+        parser.add_argument(StartupProfiler.OPTION, action='store_true',
+                            help="Write the time taken by each start up "
+                                 "phase to the log directory")
+        parser.add_argument(Tracer.OPTION, action='store_true',
+                            help="Write a Chrome trace of this run to the "
+                                 "log directory")
 
         if args:
             for a in args:
@@ -240,24 +807,62 @@ class ALXapp:
         elif self.arguments.env in ('prd', 'prod', 'production'):
             self.environment = 'prod'
 
+        if self.arguments.profile_startup:
+            profiler.enable()
+        profiler.mark("argparse")
+
         self.paths = Paths(self.name, inifile)
         """The `Paths` namespace that holds path information"""
+        profiler.mark("paths")
 
-        self.config = self.read_config(self.paths.config)
+        if self.arguments.trace or Tracer.requested():
+            TRACER.start(os.path.join(self.paths.log, self.name + ".trace.json"))
+
+        snapshot = None
+        cached = None
+        if cache_config:
+            snapshot = ConfigSnapshot(self.paths, self.environment)
+            cached = snapshot.load()
+            profiler.mark("snapshot_load")
+
+        self.config = (cached['config'] if cached
+                       else self.read_config(self.paths.config))
         """The application configuration read from `Paths.config` from a 
         call to `ALXApp.read_config`. The configuration values are assigned
         to the `ALXApp` class with a call to `ALXApp.parse_config`"""
-        if self.config and self.environment in self.config:
+        profiler.mark("read_config")
+        values = {}
+        if cached:
+            self.__dict__.update(cached['values'])
+        elif self.config and self.environment in self.config:
+            before = dict(vars(self))
             self.parse_config(self, self.config[self.environment])
+            values = {k: v for k, v in vars(self).items()
+                      if k not in before or before[k] is not v}
+        profiler.mark("parse_config")
 
         self.key = None
         """The key to encrypt and decrypt encoded strings"""
 
-        self.libconfig = self.read_lib_config()
+        self.libconfig = (LibConfig.seed(self.paths, cached['libconfig'])
+                          if cached else self.read_lib_config())
         """The global library configuration from `alx.ini`"""
+        profiler.mark("read_lib_config")
+
+        if snapshot and not cached:
+            snapshot.save({'config': self.config, 'values': values,
+                           'libconfig': self.libconfig})
+            profiler.mark("snapshot_save")
 
         # Start logging with all configured parameters
         self.start_logging()
+        profiler.mark("start_logging")
+
+        filename = profiler.write(self.name, self.paths)
+        if filename:
+            self.logger.info("Start up profile written to %s", filename)
+        if TRACER.enabled:
+            self.logger.info("Tracing to %s", TRACER.filename)
 
     @staticmethod
     def parse_config(obj: object, config: configparser.SectionProxy) -> object:
@@ -312,6 +917,15 @@ class ALXapp:
         ```
         app.output_file = /opt/local/prod/data/app/output.txt
         ```
+        Values starting with `enc:` are encrypted with `ALXapp.encrypt`.
+        They are not decrypted until they are used.  On an `ALXapp`, the
+        attribute is decrypted on first access, so scripts that never use
+        a secret never read the key:
+        ```
+        password = enc:gAAAAABm...
+        ```
+        Any other object receives a `Secret` and the plain text is
+        available from `str(obj.password)` or `obj.password.value`.
 
         :param obj: The object in which to store the configuration
          values (usually `self`)
@@ -321,11 +935,22 @@ class ALXapp:
         :return: The object with typed configuration attributes added
         """
 
+        import json
+
         try:
             for item, value in config.items():
                 # Add all the config values as string values in the app
                 value = config.get(item)
-                if '$data' in value:
+                if value.startswith(Secret.PREFIX):
+                    secret = Secret(value[len(Secret.PREFIX):].strip(),
+                                    getattr(obj, 'paths', None))
+                    if isinstance(obj, ALXapp):
+                        # Resolved by `ALXapp.__getattr__` on first access
+                        obj.__dict__.pop(item, None)
+                        obj.__dict__.setdefault('_secrets', {})[item] = secret
+                    else:
+                        setattr(obj, item, secret)
+                elif '$data' in value:
                     if hasattr(obj, 'paths'):
                         value = value.replace('$data', obj.paths.data)
                         setattr(obj, item, value)
@@ -378,31 +1003,103 @@ class ALXapp:
         if include_defaults:
             return self.parse_config(obj, config)
         else:
-            # Get keys that are explicitly defined in the section (not from defaults)
-            section_keys = (set(self.config.options(config.name)) -
-                            set(self.config.defaults().keys()))
-
-            # Also include keys from defaults that have been overridden (different values)
-            for key in self.config.defaults().keys():
-                if key in config:
-                    default_value = self.config.defaults()[key]
-                    section_value = self.config.get(config.name, key, raw=True)
-                    if default_value != section_value:
-                        section_keys.add(key)
-
             # Create a new ConfigParser with the same interpolation as the original
             section_config = configparser.ConfigParser()
-            section_config.add_section('section')
-
-            for key in section_keys:
-                if key in config:
-                    # Get the raw value to preserve %% escaping
-                    raw_value = self.config.get(config.name, key, raw=True)
-                    section_config.set('section', key, raw_value)
+            # Raw values preserve %% escaping
+            section_config.read_dict({'section': self._section_overrides(
+                config.name, self.config.defaults())})
 
             # Pass the new SectionProxy to parse_config
             return self.parse_config(obj, section_config['section'])
-        
+
+    def _section_overrides(self, name: str, defaults: dict) -> dict:
+        """
+        :param name: The section
+        :param defaults: The raw `[DEFAULT]` values
+        :return: The raw values defined in the section, either new keys or
+         defaults with a different value
+        """
+        return {key: value for key, value in self.config.items(name, raw=True)
+                if defaults.get(key) != value}
+
+    def parse_all_sections(self, schema: Union[type, dict, ConfigSchema] = None,
+                           include_defaults: bool = False,
+                           sections: list = None) -> dict:
+        """
+        Parse many sections at once, for example an ini file with a section
+        per host.  The `[DEFAULT]` values are read once and each section is
+        compared with them in a single pass, so the cost grows linearly with
+        the size of the file.
+        ```
+        hosts = app.parse_all_sections()
+        hosts["server01"].port
+        ```
+        :param schema: Optionally a dataclass, a mapping of key to type or a
+         `ConfigSchema` to load each section into, as in `load_section`.
+         Default is a `types.SimpleNamespace` typed as by `parse_config`
+        :param include_defaults: Whether the values in `[DEFAULT]` that are
+         not overridden by the section are included
+        :param sections: The sections to parse. Default is all of them,
+         including the environment sections
+        :return: A dict of section name to the typed object
+        """
+        result = {}
+        if self.config is None:
+            return result
+
+        names = self.config.sections() if sections is None else sections
+        if include_defaults:
+            parsed = self.config
+        else:
+            defaults = self.config.defaults()
+            parsed = configparser.ConfigParser()
+            parsed.read_dict({name: self._section_overrides(name, defaults)
+                              for name in names})
+
+        loader = ConfigSchema.compile(schema) if schema is not None else None
+        for name in names:
+            if loader:
+                result[name] = loader.load(parsed[name], self.paths)
+            else:
+                result[name] = self.parse_config(types.SimpleNamespace(),
+                                                 parsed[name])
+
+        return result
+
+    def load_section(self, schema: Union[type, dict, ConfigSchema],
+                     section: str = None) -> object:
+        """
+        Load a section of the application configuration into a typed
+        object declared by `schema`.  See `ConfigSchema` for the
+        supported schemas.  Unlike `parse_config`, the values are not
+        stored in the app:
+        ```
+        @dataclass(slots=True)
+        class Settings:
+            threshold: int
+            hosts: list
+
+        settings = app.load_section(Settings)
+        ```
+
+        :param schema: A dataclass, a mapping of key to type or a `ConfigSchema`
+        :param section: The section to load. Default is the environment
+        :return: An instance of the schema
+        :raises ValueError: If a value does not match its declared type
+        """
+        section = section or self.environment
+        config = None
+        if self.config is not None:
+            if section in self.config:
+                config = self.config[section]
+            elif section != self.environment:
+                raise ValueError("No section [%s] in %s" % (section,
+                                                            self.paths.config))
+            else:
+                config = self.config[self.config.default_section]
+
+        return ConfigSchema.compile(schema).load(config, self.paths)
+
     @staticmethod
     def read_config(filename: str, filename2: str = None):
         """
@@ -434,18 +1131,15 @@ class ALXapp:
         On first invocation, the user files are checked and created if
         they don't exist.
 
+        The configuration is read once per process and shared through
+        `LibConfig`. Use `LibConfig.reload` to read the files again.
+
         :return: The merge `configparser.ConfigParser` configuration
         """
         if not hasattr(self, 'paths'):
-            self.paths = Paths("alx-common")
+            self.paths = LibConfig.paths()
 
-        # If the user configuration doesn't exist, create them
-        self.paths.create_configuration_files()
-
-        merged_config = ALXapp.read_config(self.paths.global_config,
-                                           self.paths.local_config)
-
-        return merged_config
+        return LibConfig.get(self.paths)
 
     def start_logging(self):
         """
@@ -454,9 +1148,32 @@ class ALXapp:
         number of days configured in `alx.ini`.  The loglevel and
         format are also set in the config file.
 
+        Files are also rolled when they reach `maxsize` bytes and, if
+        `compress` is `gzip` or `zstd`, the rolled files are compressed in
+        the background. See `alx.log_util.SizedTimedRotatingFileHandler`.
+
         If the application is in development mode, a console logger
         is also added for convenience
+
+        If `mode` in the `[logging]` section is `queue`, the caller only
+        puts records on a queue of `queue_size` and a background thread
+        writes them to the file and console.  When the queue is full,
+        `queue_policy` decides if records are dropped (`drop`) or the
+        caller waits (`block`).  The queue is flushed on exit.
+        ```
+        [logging]
+        mode:           queue
+        queue_size:     10000
+        queue_policy:   drop
+        ```
+
+        The handlers are only installed once per process. If `ALXapp` is
+        created again with the same log file and `[logging]` settings,
+        the existing handlers are reused and only the level is changed.
+        Otherwise they are replaced. See `stop_logging` to remove them.
         """
+        from alx.log_util import SizedTimedRotatingFileHandler
+
         days = self.libconfig.getint('logging', 'days')
         log_format = self.libconfig.get('logging', 'format')
         when = self.libconfig.get('logging', 'when')
@@ -468,26 +1185,202 @@ class ALXapp:
 
         self.logger.setLevel(loglevel)
 
+        signature = (str(self.paths.logfile), self.is_dev(),
+                     tuple(self.libconfig.items('logging', raw=True)))
+        if signature == ALXapp._log_signature:
+            for handler in ALXapp._log_handlers:
+                handler.setLevel(loglevel)
+            if ALXapp.log_listener:
+                for handler in ALXapp.log_listener.handlers:
+                    handler.setLevel(loglevel)
+            self.logger.debug("Starting application '%s', reusing log handlers "
+                              "at level '%s'", self.name, loglevel)
+            return
+
+        self.stop_logging()
+
         if not os.path.isdir(self.paths.log):
             os.makedirs(self.paths.log)
 
-        fh = TimedRotatingFileHandler(self.paths.logfile, when=when,
-                                      backupCount=days)
+        fh = SizedTimedRotatingFileHandler(
+            self.paths.logfile, when=when, days=days,
+            max_bytes=self.libconfig.getint('logging', 'maxsize', fallback=0),
+            compress=self.libconfig.get('logging', 'compress', fallback=None))
         formatter = logging.Formatter(log_format)
         fh.setLevel(loglevel)
         fh.setFormatter(formatter)
-        self.logger.addHandler(fh)
+        handlers = [fh]
 
         if self.is_dev():
             # Also log to console...
             ch = logging.StreamHandler()
             ch.setLevel(loglevel)
             ch.setFormatter(formatter)
-            self.logger.addHandler(ch)
+            handlers.append(ch)
+
+        mode = self.libconfig.get('logging', 'mode', fallback='direct')
+        if mode == 'queue':
+            handlers.append(self._start_queue_logging(handlers))
+        else:
+            for handler in handlers:
+                self.logger.addHandler(handler)
+
+        ALXapp._log_handlers = handlers
+        ALXapp._log_signature = signature
 
         self.logger.debug("Starting application '%s', logging at level '%s'",
                           format(self.name), format(loglevel))
 
+    def _start_queue_logging(self, handlers: list) -> logging.Handler:
+        """
+        Attach a `BoundedQueueHandler` to the logger and start a listener
+        thread that passes the records on to `handlers`
+
+        :param handlers: The handlers that do the actual I/O
+        :return: The `BoundedQueueHandler` added to the logger
+        """
+        import atexit
+        import queue
+        from alx.log_util import BoundedQueueHandler, BlockingQueueListener
+
+        size = self.libconfig.getint('logging', 'queue_size', fallback=10000)
+        policy = self.libconfig.get('logging', 'queue_policy', fallback='drop')
+        if policy not in ('drop', 'block'):
+            raise ValueError("[logging] queue_policy must be 'drop' or "
+                             "'block', not '%s'" % policy)
+
+        log_queue = queue.Queue(size)
+        listener = BlockingQueueListener(log_queue, *handlers,
+                                         respect_handler_level=True)
+        listener.start()
+        # Registered once only, `_stop_log_listener` finds the current listener
+        atexit.unregister(ALXapp._stop_log_listener)
+        atexit.register(ALXapp._stop_log_listener)
+        ALXapp.log_listener = listener
+        handler = BoundedQueueHandler(log_queue, block=policy == 'block')
+        self.logger.addHandler(handler)
+
+        return handler
+
+    @classmethod
+    def _stop_log_listener(cls) -> None:
+        # Called at exit.  Records logged afterwards, by other exit handlers
+        # or daemon threads, must not wait on a queue that nobody reads, so
+        # the listener's handlers replace the queue handler on the logger
+        from alx.log_util import BoundedQueueHandler
+
+        listener = cls.log_listener
+        if not listener:
+            return
+        queued = [h for h in cls._log_handlers
+                  if isinstance(h, BoundedQueueHandler)]
+        for handler in queued:
+            handler.block = False
+        listener.stop()
+        cls.log_listener = None
+        for handler in queued:
+            cls.logger.removeHandler(handler)
+            cls._log_handlers.remove(handler)
+        for handler in listener.handlers:
+            cls.logger.addHandler(handler)
+
+    @classmethod
+    def stop_logging(cls) -> None:
+        """
+        Remove and close the handlers added by `start_logging` and stop the
+        queue listener, flushing any queued records. Handlers added to
+        `ALXapp.logger` by other code are left alone.  The next
+        `start_logging` installs new handlers.
+        """
+        if cls.log_listener:
+            cls.log_listener.stop()
+            cls.log_listener = None
+
+        for handler in cls._log_handlers:
+            cls.logger.removeHandler(handler)
+            handler.close()
+
+        ALXapp._log_handlers = []
+        ALXapp._log_signature = None
+
+    def watch_config(self, interval: float = 5.0,
+                     callback: "Callable" = None) -> "ConfigWatcher":
+        """
+        Reload the configuration of a long running application when its
+        files change.  See `alx.watch.ConfigWatcher`.
+
+        :param interval: The number of seconds between checks
+        :param callback: Optional function called as `callback(app, changed)`
+         after each reload
+        :return: The started `alx.watch.ConfigWatcher`. Call `stop` on it to
+         stop watching
+        """
+        from alx.watch import ConfigWatcher
+
+        watcher = ConfigWatcher(self, interval)
+        if callback:
+            watcher.add_callback(callback)
+        return watcher.start()
+
+    def map_parallel(self, func: "Callable", items: "Iterable",
+                     workers: int = None, mode: str = "process") -> "Iterator":
+        """
+        Run `func(item)` for each item on a pool of processes or threads and
+        yield the results as they complete
+        ```
+        for r in app.map_parallel(check_host, app.hosts, workers=8):
+            if r.error:
+                app.logger.error("%s failed: %s", r.item, r.error)
+            else:
+                app.logger.info("%s took %.2fs", r.item, r.seconds)
+        ```
+        Worker processes log to `ALXapp.logger` as usual; the records are
+        written by this process. See `alx.parallel.map_parallel`.
+
+        :param func: The function to call with each item.  It must be
+         picklable, i.e. defined at module level, in `process` mode
+        :param items: The items
+        :param workers: The number of workers. Default is the number of CPUs
+        :param mode: `process` or `thread`
+        :return: A generator of `alx.parallel.TaskResult` in completion order
+        """
+        from alx.parallel import map_parallel
+
+        return map_parallel(func, items, workers, mode, self.logger)
+
+    def span(self, name: str, **args):
+        """
+        Time a block of code when tracing is enabled with `--trace` or
+        `ALX_TRACE`.  Spans may be nested and used from any thread.  When
+        tracing is off this does almost nothing.
+        ```
+        with app.span("report", date=app.arguments.date):
+            with app.span("query"):
+                rows = db.run(sql)
+        ```
+        See `alx.trace.Tracer`.
+
+        :param name: The name of the span
+        :param args: Extra values shown with the span
+        :return: A context manager
+        """
+        return TRACER.span(name, **args)
+
+    @staticmethod
+    def traced(name: str = None) -> "Callable":
+        """
+        A decorator that runs the function in a `span`
+        ```
+        @ALXapp.traced()
+        def build_report(rows):
+            ...
+        ```
+        :param name: The name of the span. Default is the qualified name of
+         the function
+        :return: The decorator
+        """
+        return TRACER.traced(name)
+
     def set_log_level(self, level: str) -> None:
         """
         Change the logging level at runtime
@@ -496,30 +1389,33 @@ class ALXapp:
         """
         self.logger.setLevel(level)
         # Update all handlers to the new level
-        for handler in self.logger.handlers:
+        handlers = list(self.logger.handlers)
+        if ALXapp.log_listener:
+            handlers.extend(ALXapp.log_listener.handlers)
+        for handler in handlers:
             handler.setLevel(level)
 
         self.logger.info(f"Log level changed to {level}")
 
-    def _read_key(self) -> Fernet:
-        """Reads the key from `~/.config/alx/key` and uses it to encrypt and
-         decrypt strings using the `cryptography` python module"""
-
-        if not os.path.exists(self.paths.keyfile):
-            self.logger.error("Could not open %s", self.keyfile)
-            sys.exit(1)
-        st = os.stat(self.paths.keyfile)
-        if platform.system() != 'Windows' and int(oct(st.st_mode)[3:]) > 600:
-            # Apologies to Windows users but your security is too messy
-            self.logger.error("Check permissions on %s.  Too open", self.keyfile)
-            sys.exit(1)
-
-        with open(self.paths.keyfile) as k:
-            key = k.read().strip()
-
-        fernet = Fernet(key)
-
-        return fernet
+    def __getattr__(self, name: str):
+        # Only called when normal lookup fails: decrypt an `enc:` value
+        # stored by `parse_config` and keep the plain text as the attribute
+        secrets = self.__dict__.get('_secrets')
+        if secrets and name in secrets:
+            value = secrets[name].value
+            setattr(self, name, value)
+            return value
+        raise AttributeError("'%s' object has no attribute '%s'"
+                             % (type(self).__name__, name))
+
+    def _read_key(self) -> "MultiFernet":
+        """Reads the keys from `~/.config/alx/key` and uses them to encrypt and
+         decrypt strings using the `cryptography` python module.
+
+         The keys are cached for the process and shared by all `ALXapp`
+         objects.  The file is only read again when its modification time
+         or size changes"""
+        return _read_keyfile(self.paths.keyfile)
 
     def encrypt(self, string: str) -> str:
         """
@@ -538,8 +1434,7 @@ class ALXapp:
         :param string: The string to encrypt.
         :return: The encrypted string
         """
-        if not self.key:
-            self.key = self._read_key()
+        self.key = self._read_key()
         encoded = self.key.encrypt(string.encode())
         return encoded.decode()
 
@@ -561,14 +1456,51 @@ class ALXapp:
         If there are different users of an application using `ALXapp` then
         the key must be consistent or the string will fail to decrypt.
 
+        The key file can hold several keys, one per line.  The first key is
+        used to encrypt and all of them are tried to decrypt, so a new key
+        can be added at the top and old values re-encrypted with `rotate`
+        over time.  Lines starting with `#` are ignored.
+
         :param string: The string to decrypt.
         :return: The decrypted string
         """
-        if not self.key:
-            self.key = self._read_key()
+        self.key = self._read_key()
         decoded = self.key.decrypt(string.encode()).decode()
         return decoded
 
+    def encrypt_many(self, strings: list) -> list:
+        """
+        Encrypts each string in `strings` as `encrypt` does, reading the
+        key only once
+
+        :param strings: The strings to encrypt
+        :return: A list of the encrypted strings in the same order
+        """
+        self.key = key = self._read_key()
+        return [key.encrypt(s.encode()).decode() for s in strings]
+
+    def decrypt_many(self, strings: list) -> list:
+        """
+        Decrypts each string in `strings` as `decrypt` does, reading the
+        key only once
+
+        :param strings: The strings to decrypt
+        :return: A list of the decrypted strings in the same order
+        """
+        self.key = key = self._read_key()
+        return [key.decrypt(s.encode()).decode() for s in strings]
+
+    def rotate(self, string: str) -> str:
+        """
+        Re-encrypts a string with the first key in the key file.  The
+        string can have been encrypted with any of the keys in the file
+
+        :param string: The encrypted string
+        :return: The string encrypted with the current key
+        """
+        self.key = self._read_key()
+        return self.key.rotate(string.encode()).decode()
+
     def is_dev(self) -> bool:
         """
         :return: `True` if running in dev mode and `False` otherwise
@@ -0,0 +1,292 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# Provides AsyncALXdatabase, an asyncio version of ALXdatabase.  Native
+# async drivers are used when installed; otherwise the blocking driver
+# runs on a thread of its own so the event loop is never blocked.
+
+import re
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from alx.app import ALXapp
+from alx.db_util import (ALXdatabase, _SQLMessage, _prepare, _query_errors,
+                         _query_rows, _query_seconds)
+from alx.strings import normalize
+from alx.trace import TRACER
+
+
+def _numbered_placeholders(sql: str) -> str:
+    """Convert `%s` placeholders to the `$1, $2...` used by asyncpg"""
+    count = iter(range(1, sql.count('%s') + 1))
+    return re.sub(r'%s', lambda _: "$%d" % next(count), sql)
+
+
+class _ExecutorBackend:
+    """Runs a blocking `ALXdatabase` on a thread of its own"""
+    name = 'executor'
+
+    def __init__(self, params: dict) -> None:
+        self._db = ALXdatabase(**params)
+        # A DB-API connection and its cursor run one statement at a time,
+        # so calls queue for the single thread
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="alx-adb")
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args)
+
+    async def connect(self) -> None:
+        await self._call(self._db.connect)
+
+    async def run(self, sql: str, name: str, params, multi: bool) -> list:
+        return await self._call(self._db.run, sql, name, params, multi)
+
+    async def commit(self) -> None:
+        await self._call(self._db.commit)
+
+    async def rollback(self) -> None:
+        await self._call(self._db.rollback)
+
+    async def close(self) -> None:
+        await self._call(self._db.close)
+        self._executor.shutdown(wait=False)
+
+
+class _AsyncpgBackend:
+    """PostgreSQL with `asyncpg`"""
+    name = 'asyncpg'
+
+    def __init__(self, params: dict, autocommit: bool) -> None:
+        import asyncpg
+
+        self._driver = asyncpg
+        self._params = params
+        self._autocommit = autocommit
+        self._connection = None
+        self._transaction = None
+        self._lock = asyncio.Lock()
+
+    async def _begin(self) -> None:
+        # asyncpg commits each statement unless a transaction is open,
+        # so keep one open as a DB-API driver does
+        if not self._autocommit:
+            self._transaction = self._connection.transaction()
+            await self._transaction.start()
+
+    async def connect(self) -> None:
+        self._connection = await self._driver.connect(
+            user=self._params['user'], password=self._params['password'],
+            host=self._params['host'], port=self._params['port'],
+            database=self._params['database'])
+        await self._begin()
+
+    async def run(self, sql: str, name: str, params, multi: bool) -> list:
+        statement = _prepare(sql, 'postgres')
+        sql = _numbered_placeholders(statement.sql)
+        async with self._lock:
+            if multi and params:
+                await self._connection.executemany(sql, params)
+                return []
+            if statement.kind == 'select' or 'returning' in sql.lower():
+                records = await self._connection.fetch(sql, *(params or ()))
+                return [tuple(r) for r in records]
+            await self._connection.execute(sql, *(params or ()))
+            return []
+
+    async def commit(self) -> None:
+        async with self._lock:
+            if self._transaction:
+                await self._transaction.commit()
+                await self._begin()
+
+    async def rollback(self) -> None:
+        async with self._lock:
+            if self._transaction:
+                await self._transaction.rollback()
+                await self._begin()
+
+    async def close(self) -> None:
+        if self._connection:
+            await self._connection.close()
+            self._connection = None
+
+
+class _AiomysqlBackend:
+    """MySQL/MariaDB with `aiomysql`"""
+    name = 'aiomysql'
+
+    def __init__(self, params: dict, autocommit: bool) -> None:
+        import aiomysql
+
+        self._driver = aiomysql
+        self._params = params
+        self._autocommit = autocommit
+        self._connection = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        self._connection = await self._driver.connect(
+            user=self._params['user'], password=self._params['password'] or "",
+            host=self._params['host'], port=self._params['port'],
+            db=self._params['database'], autocommit=self._autocommit)
+
+    async def run(self, sql: str, name: str, params, multi: bool) -> list:
+        sql = _prepare(sql, 'mysql').sql
+        async with self._lock:
+            async with self._connection.cursor() as cursor:
+                if multi and params:
+                    await cursor.executemany(sql, params)
+                else:
+                    await cursor.execute(sql, params)
+                if cursor.description is not None:
+                    return list(await cursor.fetchall())
+                return []
+
+    async def commit(self) -> None:
+        async with self._lock:
+            await self._connection.commit()
+
+    async def rollback(self) -> None:
+        async with self._lock:
+            await self._connection.rollback()
+
+    async def close(self) -> None:
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+class AsyncALXdatabase:
+    def __init__(self, dbtype: str = 'mysql', user: str = None,
+                 password: str = None, host: str = 'localhost', database: str = None,
+                 port: int = 3306, autocommit: bool = False,
+                 native: bool = True) -> None:
+        """
+        The `ALXdatabase` interface for asyncio.  `run`, `commit`,
+        `rollback` and `close` are coroutines so a collector can have
+        hundreds of queries outstanding on one event loop:
+        ```
+        async with AsyncALXdatabase(dbtype='postgres', user=app.user,
+                                    password=app.password,
+                                    database='metrics') as db:
+            results = await asyncio.gather(
+                *[db.run(sql, params=(host,)) for host in app.hosts])
+        # <-- commits automatically, or rolls back if an error occurred
+        ```
+        If `native` is True and the driver is installed, PostgreSQL uses
+        `asyncpg` and MySQL/MariaDB `aiomysql`.  Otherwise, and always for
+        SQLite, a blocking `ALXdatabase` is run on an executor with one
+        thread belonging to this connection.  Either way a connection runs
+        one statement at a time; the others wait without blocking the loop.
+        Use several connections for parallel queries.
+
+        Statements use the same `%s` placeholders as `ALXdatabase` and rows
+        are returned as tuples.
+
+        :param dbtype: As for `ALXdatabase`
+        :param user: The username to use
+        :param password: The password to use
+        :param host: The host to connect (default is `localhost`)
+        :param database: The name of the database
+        :param port: The port (default is mariadb, 3306)
+        :param autocommit: If True then commit after each statement
+        :param native: Whether to use an async driver if one is installed
+        """
+        self.logger = ALXapp.logger
+        """The default logger from `alx.app.ALXapp.logger`"""
+        dbtype = normalize(dbtype)
+        self.dbtype = 'mysql' if dbtype == 'mariadb' else dbtype
+        """The database type"""
+        params = {'user': user, 'password': password, 'host': host,
+                  'database': database, 'port': port}
+
+        self._backend = None
+        if native and self.dbtype in ('postgres', 'mysql'):
+            backend = (_AsyncpgBackend if self.dbtype == 'postgres'
+                       else _AiomysqlBackend)
+            try:
+                self._backend = backend(params, autocommit)
+            except ImportError:
+                self.logger.debug("No native async driver for %s, using "
+                                  "a thread pool", self.dbtype)
+        if self._backend is None:
+            self._backend = _ExecutorBackend(
+                dict(params, dbtype=self.dbtype, autocommit=autocommit))
+
+        self.backend = self._backend.name
+        """`asyncpg`, `aiomysql` or `executor`"""
+
+    async def connect(self) -> "AsyncALXdatabase":
+        """
+        Connect to the database
+
+        :return: This object
+        """
+        await self._backend.connect()
+        return self
+
+    async def run(self, sql: str, name: str = None, params=None,
+                  multi: bool = False) -> list:
+        """
+        Execute a statement as `ALXdatabase.run` does
+
+        :param sql: The SQL statement to execute
+        :param name: Optionally name the query to identify it in the log
+        :param params: A tuple or list of parameters to use with the SQL query
+        :param multi: If True, use executemany() for bulk inserts
+        :return: The rows of a *select* or an empty list
+        """
+        if self.backend == 'executor':
+            # ALXdatabase logs, times and traces the statement itself
+            return await self._backend.run(sql, name, params, multi)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s", _SQLMessage(sql.strip(), name, params))
+        label = name or ""
+        start = time.perf_counter()
+        try:
+            with TRACER.span("db.run", query=label):
+                rows = await self._backend.run(sql, name, params, multi)
+        except Exception as e:
+            _query_errors.labels(label).inc()
+            self.logger.error('SQL execution failed: %s: %s',
+                              _prepare(sql, self.dbtype).header, e)
+            raise
+        _query_seconds.labels(label).observe(time.perf_counter() - start)
+        _query_rows.labels(label).inc(len(rows))
+        self.logger.debug("%d rows returned", len(rows))
+        return rows
+
+    async def commit(self) -> None:
+        """
+        Commit the current transaction
+        """
+        await self._backend.commit()
+
+    async def rollback(self) -> None:
+        """
+        Rollback the current transaction
+        """
+        await self._backend.rollback()
+
+    async def close(self) -> None:
+        """
+        Close the connection
+        """
+        await self._backend.close()
+
+    async def __aenter__(self) -> "AsyncALXdatabase":
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type:
+                await self.rollback()
+            else:
+                await self.commit()
+        finally:
+            await self.close()
@@ -6,40 +6,505 @@
 # PostgreSQL, and SQLite backends using a consistent API.
 #
 from alx.app import ALXapp
+import os
 import re
-from typing import Any
+import sys
+import time
+import logging
+import functools
+import itertools
+import threading
+import weakref
+from array import array
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+from alx.metrics import REGISTRY
+from alx.trace import TRACER, traced
 from alx.strings import normalize
-from sql_formatter.core import format_sql
-# Only want to support modules that are installed.
-try:
-    import psycopg2
-    has_postgres = True
-except ImportError:
-    psycopg2 = None
-    has_postgres = False
-try:
-    import sqlite3
-    has_sqlite = True
-except ImportError:
-    sqlite3 = None
-    has_sqlite = False  # basically always True, part of stdlib
-try:
-    import mariadb as mysql
-    has_mysql = True
-except ImportError:
+
+_query_seconds = REGISTRY.histogram(
+    "alx_db_query_seconds", "Time to execute and fetch a query", ("query",))
+_query_rows = REGISTRY.counter(
+    "alx_db_rows_total", "Rows returned or affected by a query", ("query",))
+_query_errors = REGISTRY.counter(
+    "alx_db_errors_total", "Queries that raised an exception", ("query",))
+# Names of PostgreSQL server side cursors
+_stream_ids = itertools.count(1)
+# The `ResultCache` objects with a file, saved at exit
+_persistent_caches = weakref.WeakSet()
+
+
+def _import_driver(dbtype: str) -> Any:
+    """
+    Import the DB-API module for `dbtype` on first use.  Drivers are not
+    imported with `alx.db_util` as they are slow to load and most scripts
+    only ever use one of them.
+
+    :param dbtype: The normalised database type: `mysql`, `postgres` or `sqlite`
+    :return: The driver module
+    :raises RuntimeError: If no driver for `dbtype` is installed
+    """
     try:
-        import pymysql as mysql
-        has_mysql = True
+        if dbtype == 'mysql':
+            try:
+                import mariadb as mysql
+            except ImportError:
+                import pymysql as mysql
+            return mysql
+        elif dbtype == 'postgres':
+            import psycopg2
+            return psycopg2
+        elif dbtype == 'sqlite':
+            import sqlite3
+            return sqlite3
     except ImportError:
-        has_mysql = False
-        mysql = None
+        names = {'mysql': 'MySQL/MariaDB', 'postgres': 'PostgreSQL',
+                 'sqlite': 'SQLite'}
+        raise RuntimeError("%s support not available" % names[dbtype])
+
+    raise ValueError(f"Unsupported database type: {dbtype}")
+
+
+@functools.lru_cache(maxsize=256)
+def _format_sql(sql: str) -> str:
+    """Pretty print `sql` for the log.  `sql_formatter` is only imported
+    when debug logging is actually emitted.  Statements run in a loop are
+    only formatted once"""
+    from sql_formatter.core import format_sql
+    return format_sql(sql)
+
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][\w$]*(\.[A-Za-z_][\w$]*)?$')
+_READS = re.compile(r'\b(?:from|join)\s+([\w$."`]+)', re.IGNORECASE)
+_WRITES = re.compile(r'\b(?:into|update|from)\s+([\w$."`]+)', re.IGNORECASE)
+# Quoted text, brackets and words, enough to find the verbs of a `WITH`
+_TOKENS = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`|[()]|[A-Za-z_]\w*")
+
+
+def _copy_value(value) -> str:
+    """
+    Format `value` for PostgreSQL `COPY ... FROM STDIN` text format.
+    Bytes are written in the `bytea` hex format and lists and dicts as
+    JSON for `json` and `jsonb` columns
+
+    :raises ValueError: For a set, which has no COPY representation
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # \x<hex>, with the backslash escaped for COPY
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        import json
+        value = json.dumps(value)
+    elif isinstance(value, (set, frozenset)):
+        raise ValueError("Cannot COPY a %s: %r" % (type(value).__name__, value))
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+ROW_FACTORIES = ('tuple', 'namedtuple', 'dict')
+"""The row factories accepted by `ALXdatabase.set_row_factory`"""
+
+
+@functools.lru_cache(maxsize=256)
+def _row_class(names: tuple) -> type:
+    """The `namedtuple` class for a set of column names, made once per
+    signature.  Columns that are not identifiers are named `_<index>`"""
+    return namedtuple('Row', names, rename=True)
+
+
+def _make_rows(rows: list, names: tuple, factory: str) -> list:
+    """Convert the driver's tuples to rows made by `factory`"""
+    if factory == 'namedtuple':
+        return list(map(_row_class(names)._make, rows))
+    if factory == 'dict':
+        return [dict(zip(names, row)) for row in rows]
+    return rows
+
+
+def _new_column(value) -> Any:
+    """An empty column for values like `value`"""
+    if isinstance(value, bool):
+        return []
+    if isinstance(value, int):
+        return array('q')
+    if isinstance(value, float):
+        return array('d')
+    return []
+
+
+def _extend_column(column, values: tuple) -> Any:
+    """
+    Add `values` to `column`, widening an integer array to float if the
+    values include a float, or any array to a list if a value does not fit.
+    Integers too large for an int64 go to a list so they keep their value
+
+    :return: The column, which may be a new object
+    """
+    if type(column) is list:
+        column.extend(values)
+        return column
+    n = len(column)
+    try:
+        column.extend(values)
+        return column
+    except (TypeError, OverflowError):
+        # array.extend may have added some of the values
+        del column[n:]
+    types = set(map(type, values))
+    if column.typecode == 'q' and float in types and types <= {int, float}:
+        wider = array('d', column)
+        wider.extend(values)
+        return wider
+    wider = column.tolist()
+    wider.extend(values)
+    return wider
+
+
+def _read_columns(cursor, batch_size: int, numpy: bool) -> tuple:
+    """
+    Fetch the result set of `cursor` with `fetchmany` into columns
+
+    :return: A tuple of the dict of columns and the number of rows
+    """
+    rows = cursor.fetchmany(batch_size)
+    # Named cursors only have a description after the first fetch
+    names = [d[0] for d in cursor.description]
+    columns = None
+    count = 0
+    while rows:
+        count += len(rows)
+        values = list(zip(*rows))
+        if columns is None:
+            columns = [_new_column(next((v for v in col if v is not None), None))
+                       for col in values]
+        columns = [_extend_column(c, v) for c, v in zip(columns, values)]
+        rows = cursor.fetchmany(batch_size)
+    if columns is None:
+        columns = [[] for _ in names]
+
+    if numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("NumPy support not available")
+        columns = [np.frombuffer(c, dtype=np.int64 if c.typecode == 'q'
+                                 else np.float64) if type(c) is array else c
+                   for c in columns]
+
+    return dict(zip(names, columns)), count
+
+
+class _Statement:
+    """
+    What `ALXdatabase.run` needs to know about a statement, worked out once
+    per statement text and database type by `_prepare`
+    """
+    __slots__ = ('sql', 'header', 'kind', 'tables')
+
+    SELECT = ('select', 'show', 'explain', 'describe', 'desc', 'pragma',
+              'values')
+    DML = ('insert', 'update', 'delete', 'replace', 'upsert', 'merge')
+    CONTROL = ('begin', 'start', 'commit', 'end', 'rollback', 'savepoint',
+               'release', 'set')
+
+    def __init__(self, sql: str, dbtype: str) -> None:
+        sql = sql.strip()
+        if dbtype == 'sqlite':
+            sql = re.sub(r'%s', '?', sql)
+        self.sql = sql
+        """The statement to execute, with placeholders for the database"""
+        self.header = " ".join(sql[:200].split())[:80]
+        """A one line summary of the statement for log messages"""
+        verb = sql.split(None, 1)[0].lower() if sql else ''
+        if verb == 'with':
+            verb = self._with_verb(sql)
+        self.kind = ('select' if verb in self.SELECT else
+                     'dml' if verb in self.DML else
+                     'control' if verb in self.CONTROL else 'other')
+        """`select`, `dml`, `control` for transactions and `set`, or
+        `other`, such as DDL, whose effect on the data is not known"""
+        pattern = _WRITES if self.kind == 'dml' else _READS
+        self.tables = tuple(sorted({t.strip('"`').lower()
+                                    for t in pattern.findall(sql)}))
+        """The tables read by a *select* or written by a DML statement"""
+
+    def _with_verb(self, sql: str) -> str:
+        """
+        The verb of a `WITH` statement: a DML verb if the main statement
+        or any common table expression writes, otherwise the main verb
+        """
+        main = None
+        depth = 0
+        opened = False
+        for token in _TOKENS.findall(sql):
+            if token == '(':
+                depth += 1
+                opened = True
+                continue
+            if token == ')':
+                depth -= 1
+                continue
+            word = token.lower()
+            if opened and word in self.DML:
+                # A data modifying CTE, `WITH d AS (DELETE ...)`
+                return word
+            opened = False
+            if depth == 0 and main is None and word in self.SELECT + self.DML:
+                main = word
+        return main or 'other'
+
+
+@functools.lru_cache(maxsize=1024)
+def _prepare(sql: str, dbtype: str) -> _Statement:
+    """The cached `_Statement` for the raw `sql` text"""
+    return _Statement(sql, dbtype)
+
+
+class _SQLMessage:
+    """
+    The debug message for a statement.  It is passed to the logger as is
+    and only formatted if a handler writes the record
+    """
+    __slots__ = ('sql', 'name', 'params')
+
+    def __init__(self, sql: str, name: str, params) -> None:
+        self.sql = sql
+        self.name = name
+        self.params = params
+
+    def __str__(self) -> str:
+        if self.name:
+            log = "%s:\n%s" % (self.name, _format_sql(self.sql))
+        else:
+            log = _format_sql("\n" + self.sql)
+
+        if self.params:
+            log += "\nParams: %s" % (format(self.params))
+
+        return log
+
+
+def _save_result_caches() -> None:
+    """Save every `ResultCache` with a file at exit"""
+    for cache in list(_persistent_caches):
+        cache.save()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 filename: str = None) -> None:
+        """
+        Keeps the results of *select* statements for a time so scripts that
+        read the same reference data every sample do not query it again.
+        Attach it with `ALXdatabase.set_result_cache` and pass `cache_ttl`
+        to `ALXdatabase.run` for the statements that may be cached:
+        ```
+        db.set_result_cache(ResultCache.persistent(app))
+        hosts = db.run("SELECT host FROM hosts WHERE site = %s",
+                       params=(site,), cache_ttl=300)
+        ```
+        Results are keyed by the database, the statement with its
+        whitespace normalised and the parameters.  Each result is tagged
+        with the tables it reads, or the `tags` passed to `run`.  An
+        `insert`, `update` or `delete` run through the same `ALXdatabase`
+        drops the results tagged with the table it writes, and a statement
+        such as `truncate`, `drop` or `alter` drops all the results; changes
+        made elsewhere are only seen when the TTL expires or `invalidate`
+        is called.
+
+        When the estimated size of the results passes `max_bytes`, the
+        least recently used are dropped.
+
+        :param max_bytes: The approximate memory the results may use
+        :param filename: If set, results are loaded from this file and
+         saved to it by `save` and at exit so they survive between runs
+        """
+        self.max_bytes = max_bytes
+        """The approximate memory the results may use"""
+        self.filename = filename
+        """The file the results are kept in between runs"""
+        self.hits = 0
+        """The number of results served from the cache"""
+        self.misses = 0
+        """The number of cacheable statements that were executed"""
+        self.evictions = 0
+        """The number of results dropped to stay under `max_bytes`"""
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        if filename:
+            import atexit
+            self._load()
+            _persistent_caches.add(self)
+            # Registered once only, the caches are held weakly
+            atexit.unregister(_save_result_caches)
+            atexit.register(_save_result_caches)
+
+    @classmethod
+    def persistent(cls, app: ALXapp, **kwargs) -> "ResultCache":
+        """
+        :param app: The application
+        :param kwargs: Passed to `ResultCache`
+        :return: A cache kept in `<app.paths.data>/<app.name>.results`
+        """
+        os.makedirs(app.paths.data, exist_ok=True)
+        return cls(filename=os.path.join(app.paths.data, app.name + ".results"),
+                   **kwargs)
+
+    @staticmethod
+    def key(scope: tuple, sql: str, params) -> tuple:
+        """
+        :param scope: Identifies the database
+        :param sql: The statement
+        :param params: The parameters
+        :return: The cache key
+        """
+        return scope, " ".join(sql.split()), repr(params)
+
+    @staticmethod
+    def _sizeof(rows: list) -> int:
+        return sys.getsizeof(rows) + sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+            for row in rows)
+
+    def get(self, key: tuple) -> list:
+        """
+        :param key: From `key`
+        :return: A copy of the cached rows or `None` if not cached or expired
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: tuple) -> tuple:
+        """
+        :param key: From `key`
+        :return: A tuple of a copy of the cached rows and the column names
+         or `None` if not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[1]), entry[4]
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, rows: list, ttl: float, tags: tuple = (),
+            columns: tuple = None) -> None:
+        """
+        Cache `rows` for `ttl` seconds
+
+        :param key: From `key`
+        :param rows: The result set as tuples
+        :param ttl: Seconds the result is valid
+        :param tags: Names, usually tables, for `invalidate`
+        :param columns: The column names
+        """
+        size = self._sizeof(rows)
+        if size > self.max_bytes:
+            return
+        tags = tuple(tag.lower() for tag in tags)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.time() + ttl, list(rows), size, tags,
+                                  columns)
+            self._size += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        # Called with the lock held
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+            for tag in entry[3]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    def invalidate(self, *tags: str) -> int:
+        """
+        Drop the results with any of `tags`, or all results if none are given
+
+        :param tags: Table names or the tags passed to `ALXdatabase.run`
+        :return: The number of results dropped
+        """
+        with self._lock:
+            if not tags:
+                count = len(self._entries)
+                self._entries.clear()
+                self._tags.clear()
+                self._size = 0
+                return count
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag.lower(), set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        """
+        :return: A dict of `entries`, `bytes`, `hits`, `misses` and `evictions`
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def _load(self) -> None:
+        import pickle
+
+        try:
+            with open(self.filename, 'rb') as f:
+                entries = pickle.load(f)
+            now = time.time()
+            for key, (expires, rows, size, tags, columns) in entries.items():
+                if expires > now:
+                    self.put(key, rows, expires - now, tags, columns)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            ALXapp.logger.warning("Ignoring result cache %s: %s", self.filename, e)
+
+    def save(self) -> None:
+        """
+        Write the unexpired results to `filename`
+        """
+        import pickle
+
+        if not self.filename:
+            return
+        now = time.time()
+        with self._lock:
+            entries = {k: v for k, v in self._entries.items() if v[0] > now}
+        tmp = "%s.%d.tmp" % (self.filename, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.filename)
+        except Exception as e:
+            ALXapp.logger.warning("Could not save result cache %s: %s",
+                                  self.filename, e)
 
 
 class ALXdatabase:
     def __init__(self, dbtype: str = 'mysql', user: str = None,
                  password: str = None, host: str = 'localhost', database: str = None,
                  port: int = 3306, autoconnect: bool = False,
-                 autocommit: bool = False) -> None:
+                 autocommit: bool = False, row_factory: str = 'tuple') -> None:
         """
         Simplifies and removes repetitive statements to connect to a database.
 
@@ -58,6 +523,8 @@ class ALXdatabase:
             initialisation. Default is False
         :param autocommit: If True then execute `commit` after each
             successful transaction
+        :param row_factory: How rows are returned by `run` and `stream`.
+            See `set_row_factory`
 
         You can also do this:
         ```
@@ -79,6 +546,11 @@ class ALXdatabase:
         making the database connection"""
         self.autocommit = autocommit
         """Whether to automatically commit a successful transaction"""
+        self.result_cache = None
+        """The `ResultCache` set with `set_result_cache`"""
+        self.row_factory = 'tuple'
+        """How rows are returned, set with `set_row_factory`"""
+        self.set_row_factory(row_factory)
 
         dbtype = normalize(dbtype)
 
@@ -92,6 +564,7 @@ class ALXdatabase:
                         'port': port}
         if self.dbtype == 'sqlite':
             self._params['database'] = database or ':memory:'
+        self._sqlite_options = {}
 
         self.logger.info("Initialising %s database connection to %s on %s as %s",
                          dbtype, self._params['database'], self._params['host'],
@@ -100,6 +573,7 @@ class ALXdatabase:
         if autoconnect:
             self.connect()
 
+    @traced("db.connect")
     def connect(self) -> Any:
         """
         Initiates a connection to the database with parameters set
@@ -109,20 +583,12 @@ class ALXdatabase:
         with the parameters set in `ALXdatabase`
         """
         try:
-            if self.dbtype == 'mysql':
-                if not has_mysql:
-                    raise RuntimeError("MySQL/MariaDB support not available")
-                self.connection = mysql.connect(**self._params)
-            elif self.dbtype == 'postgres':
-                if not has_postgres:
-                    raise RuntimeError("PostgreSQL support not available")
-                self.connection = psycopg2.connect(**self._params)
-            elif self.dbtype == 'sqlite':
-                if not has_sqlite:
-                    raise RuntimeError("SQLite support not available")
-                self.connection = sqlite3.connect(self._params['database'])
+            driver = _import_driver(self.dbtype)
+            if self.dbtype == 'sqlite':
+                self.connection = driver.connect(self._params['database'],
+                                                 **self._sqlite_options)
             else:
-                raise ValueError(f"Unsupported database type: {self.dbtype}")
+                self.connection = driver.connect(**self._params)
         except Exception as e:
             self.logger.error("Connection failed: %s", format(e))
 
@@ -131,13 +597,59 @@ class ALXdatabase:
         return self.cursor
 
     def _convert_placeholders(self, sql: str) -> str:
-        if self.dbtype == 'sqlite':
-            return re.sub(r'%s', '?', sql)
-        return sql
+        return _prepare(sql, self.dbtype).sql
+
+    def set_row_factory(self, factory: str) -> None:
+        """
+        Choose how `run` and `stream` return rows
+        * `tuple`: the driver's tuples, the default and the least work
+        * `namedtuple`: tuples with the columns also available as attributes,
+          `row.host`.  The class is made once per set of column names and a
+          row takes no more memory than a plain tuple.  Columns that are
+          not valid identifiers, such as `count(*)`, are named `_<index>`
+          unless given an alias
+        * `dict`: a dict of column name to value per row, which takes
+          several times the memory of a tuple
+
+        :param factory: One of `ROW_FACTORIES`
+        :raises ValueError: If `factory` is unknown
+        """
+        if factory not in ROW_FACTORIES:
+            raise ValueError("row_factory must be one of %s, not '%s'"
+                             % (", ".join(ROW_FACTORIES), factory))
+        self.row_factory = factory
+
+    def set_result_cache(self, cache: ResultCache) -> None:
+        """
+        Cache the results of statements run with `cache_ttl`
+
+        :param cache: The cache, which may be shared by several connections
+        """
+        self.result_cache = cache
+
+    @staticmethod
+    def statement_cache_info() -> Any:
+        """
+        Statements passed to `run` and `stream` are stripped, their
+        placeholders converted and their kind worked out once.  The last
+        1024 are kept, keyed by the statement text and database type, so
+        running the same statement in a loop costs a single lookup.
+
+        :return: A `functools` cache info of `hits`, `misses`, `maxsize`
+         and `currsize`
+        """
+        return _prepare.cache_info()
+
+    def _log_statement(self, sql: str, name: str, params) -> None:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s", _SQLMessage(sql, name, params))
 
     def run(self, sql: str, name: str = None,
             params=None,
-            multi: bool = False) -> list:
+            multi: bool = False,
+            cache_ttl: float = None,
+            tags: tuple = None,
+            as_columns: bool = False) -> Any:
         """
         Tidies up the SQL string passed, logs the statement to
         `ALXapp.logger` and executes the statement on the
@@ -153,51 +665,320 @@ class ALXdatabase:
         :param name: Optionally name the query to identify it in the log
         :param params: A tuple or list of parameters to use with the SQL query.
         :param multi: If True, use executemany() for bulk inserts.
+        :param cache_ttl: If a `ResultCache` is set, a *select* result is
+         cached for this many seconds
+        :param tags: The tags for the cached result. Default is the tables
+         in the statement
+        :param as_columns: If True, return a *select* result as a dict of
+         columns as `fetch_columns` does.  Such results are not cached
 
         :return: If a *select* statement then the result set
-        from the call to execute on the `cursor` or
+        from the call to execute on the `cursor`, with rows made by the
+        `row_factory`, or
         an empty list if an `insert`, `update`, `upsert` or
         `replace` statement
         """
-        sql = sql.strip()
-        sql = self._convert_placeholders(sql)
+        statement = _prepare(sql, self.dbtype)
+        sql = statement.sql
+        self._log_statement(sql, name, params)
 
-        if name:
-            log = "%s:\n%s" % (name, format_sql(sql))
-        else:
-            log = format_sql("\n" + sql)
+        cache = self.result_cache
+        key = None
+        if cache is not None:
+            if cache_ttl and statement.kind == 'select' and not as_columns:
+                key = cache.key((self.dbtype, self._params['host'],
+                                 self._params['port'], self._params['database']),
+                                sql, params)
+                entry = cache.get_entry(key)
+                if entry is not None:
+                    rows, names = entry
+                    self.logger.debug("%d rows returned from cache", len(rows))
+                    return _make_rows(rows, names, self.row_factory)
+            elif statement.kind == 'dml' and statement.tables:
+                cache.invalidate(*statement.tables)
+            elif statement.kind in ('dml', 'other'):
+                # Such as TRUNCATE, DROP or ALTER; drop everything
+                cache.invalidate()
 
-        if params:
-            log += "\nParams: %s" % (format(params))
+        label = name or ""
+        start = time.perf_counter()
+        with TRACER.span("db.run", query=label, kind=statement.kind):
+            try:
+                if multi and params:
+                    self.cursor.executemany(sql, params)
+                elif params:
+                    self.cursor.execute(sql, params)
+                else:
+                    self.cursor.execute(sql)
+                if self.autocommit:
+                    try:
+                        self.connection.commit()
+                    except Exception as e:
+                        self.logger.warning("Autocommit failed: %s", e)
+            except Exception as e:
+                _query_errors.labels(label).inc()
+                self.logger.error('SQL execution failed: %s: %s',
+                                  statement.header, e)
+                raise
 
-        self.logger.debug(log)
+            rows = None
+            if self.cursor.description is not None:
+                if as_columns:
+                    columns, count = _read_columns(self.cursor, 10000, False)
+                else:
+                    rows = self.cursor.fetchall()
 
-        try:
-            if multi and params:
-                self.cursor.executemany(sql, params)
-            elif params:
-                self.cursor.execute(sql, params)
-            else:
-                self.cursor.execute(sql)
-            if self.autocommit:
-                try:
-                    self.connection.commit()
-                except Exception as e:
-                    self.logger.warning("Autocommit failed: %s", e)
-        except Exception as e:
-            self.logger.error('SQL execution failed: %s', e)
-            raise
+        if as_columns and self.cursor.description is not None:
+            _query_seconds.labels(label).observe(time.perf_counter() - start)
+            _query_rows.labels(label).inc(count)
+            self.logger.debug("%d rows returned in columns", count)
+            return columns
 
-        if self.cursor.description is not None:
-            rows = self.cursor.fetchall()
+        if rows is not None:
+            _query_seconds.labels(label).observe(time.perf_counter() - start)
+            _query_rows.labels(label).inc(len(rows))
             self.logger.debug("%d rows returned", len(rows))
-            return rows
+            names = tuple(d[0] for d in self.cursor.description)
+            if key is not None:
+                cache.put(key, rows, cache_ttl,
+                          statement.tables if tags is None else tags, names)
+            return _make_rows(rows, names, self.row_factory)
 
+        _query_seconds.labels(label).observe(time.perf_counter() - start)
         if self.cursor.rowcount >= 0:
+            _query_rows.labels(label).inc(self.cursor.rowcount)
             self.logger.debug("%d rows affected", self.cursor.rowcount)
 
         return []
 
+    def _stream_cursor(self) -> Any:
+        """
+        :return: A cursor that leaves the result set on the server until
+         it is fetched
+        """
+        if self.dbtype == 'postgres':
+            # A named cursor is a server side cursor in psycopg2
+            return self.connection.cursor(name="alx_stream_%d" % next(_stream_ids))
+        if self.dbtype == 'mysql':
+            driver = _import_driver(self.dbtype)
+            if driver.__name__ == 'pymysql':
+                return self.connection.cursor(driver.cursors.SSCursor)
+            return self.connection.cursor(buffered=False)
+        return self.connection.cursor()
+
+    def stream(self, sql: str, params=None, batch_size: int = 1000,
+               name: str = None) -> Iterator:
+        """
+        Execute a *select* and yield the rows as they are fetched, in
+        batches of `batch_size` with `fetchmany`, rather than loading the
+        whole result set into memory as `run` does.  Processing can start
+        as soon as the first batch arrives.
+        ```
+        for host, value in db.stream("SELECT host, value FROM samples"):
+            totals[host] += value
+        ```
+        The result set is kept on the server: PostgreSQL uses a named
+        (server side) cursor, which must be read inside a transaction, and
+        MySQL/MariaDB an unbuffered cursor.  With MySQL/MariaDB no other
+        statement can be run on the connection until all the rows have
+        been read or the generator is closed.  SQLite reads rows from the
+        file as they are fetched.
+
+        :param sql: The *select* statement
+        :param params: A tuple or list of parameters to use with the SQL query
+        :param batch_size: The number of rows fetched at a time
+        :param name: Optionally name the query to identify it in the log
+        :return: A generator of rows
+        """
+        statement = _prepare(sql, self.dbtype)
+        sql = statement.sql
+        self._log_statement(sql, name, params)
+
+        label = name or ""
+        start = time.perf_counter()
+        count = 0
+        cursor = self._stream_cursor()
+        if self.dbtype == 'postgres':
+            cursor.itersize = batch_size
+        try:
+            with TRACER.span("db.execute", query=label):
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+            names = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                count += len(rows)
+                if self.row_factory == 'tuple':
+                    yield from rows
+                else:
+                    if names is None:
+                        names = tuple(d[0] for d in cursor.description)
+                    yield from _make_rows(rows, names, self.row_factory)
+        except Exception as e:
+            _query_errors.labels(label).inc()
+            self.logger.error('SQL execution failed: %s: %s',
+                              statement.header, e)
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            _query_seconds.labels(label).observe(time.perf_counter() - start)
+            _query_rows.labels(label).inc(count)
+            self.logger.debug("%d rows streamed", count)
+
+    def fetch_columns(self, sql: str, params=None, batch_size: int = 10000,
+                      name: str = None, numpy: bool = False) -> dict:
+        """
+        Execute a *select* and return the result set as columns rather than
+        rows.  Integer and float columns are `array.array` of 8 byte values,
+        a fraction of the memory of a Python object per cell, and other
+        columns are lists.  A numeric column that contains a `NULL` becomes
+        a list.  Rows are read in batches of `batch_size` on a server side
+        cursor, as `stream` does, so the rows are never all in memory.
+        ```
+        columns = db.fetch_columns("SELECT host, cpu FROM samples", numpy=True)
+        print(columns["cpu"].mean())
+        ```
+
+        :param sql: The *select* statement
+        :param params: A tuple or list of parameters to use with the SQL query
+        :param batch_size: The number of rows fetched at a time
+        :param name: Optionally name the query to identify it in the log
+        :param numpy: If True, numeric columns are returned as NumPy arrays
+         sharing the memory of the `array.array`. Needs `pip install numpy`
+        :return: A dict of column name to column in the order of the select
+        """
+        statement = _prepare(sql, self.dbtype)
+        sql = statement.sql
+        self._log_statement(sql, name, params)
+
+        label = name or ""
+        start = time.perf_counter()
+        cursor = self._stream_cursor()
+        if self.dbtype == 'postgres':
+            cursor.itersize = batch_size
+        try:
+            with TRACER.span("db.fetch_columns", query=label):
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+                columns, count = _read_columns(cursor, batch_size, numpy)
+        except Exception as e:
+            _query_errors.labels(label).inc()
+            self.logger.error('SQL execution failed: %s: %s',
+                              statement.header, e)
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+        _query_seconds.labels(label).observe(time.perf_counter() - start)
+        _query_rows.labels(label).inc(count)
+        self.logger.debug("%d rows returned in columns", count)
+        return columns
+
+    def bulk_insert(self, table: str, columns: list, rows: Iterable,
+                    chunk_size: int = 1000, commit: str = 'end') -> dict:
+        """
+        Insert many rows as fast as the database allows.  `rows` is read a
+        chunk at a time so it can be a generator over a file or another
+        query and the rows are never all in memory.  Each chunk is sent with
+        * PostgreSQL: `COPY table (columns) FROM STDIN`
+        * MySQL/MariaDB: one `INSERT` with a `VALUES` list of the chunk
+        * SQLite: `executemany` in a single transaction
+        ```
+        stats = db.bulk_insert("samples", ["host", "time", "value"],
+                               csv.reader(f), chunk_size=5000)
+        ```
+        Results in the `result_cache` tagged with `table` are dropped as
+        each chunk is inserted.
+
+        :param table: The table name, optionally with a schema
+        :param columns: The column names in the order of the values in a row
+        :param rows: An iterable of sequences of values
+        :param chunk_size: The number of rows sent at a time
+        :param commit: `end` to commit once all the rows are inserted,
+         `chunk` to commit after each chunk or `None` to leave it to the
+         caller.  If an error occurs, uncommitted rows are rolled back
+        :return: A dict of `rows`, `chunks`, `seconds` and `rows_per_second`
+        :raises ValueError: If the table or a column is not a plain identifier
+        """
+        for identifier in [table] + list(columns):
+            if not _IDENTIFIER.match(identifier):
+                raise ValueError("Invalid identifier: %r" % identifier)
+        if commit not in ('end', 'chunk', None):
+            raise ValueError("commit must be 'end', 'chunk' or None")
+
+        column_list = ", ".join(columns)
+        marks = ", ".join(["%s"] * len(columns))
+        if self.dbtype == 'sqlite':
+            sql = self._convert_placeholders(
+                "INSERT INTO %s (%s) VALUES (%s)" % (table, column_list, marks))
+        elif self.dbtype == 'mysql':
+            sql = "INSERT INTO %s (%s) VALUES " % (table, column_list)
+            marks = "(%s)" % marks
+        else:
+            sql = "COPY %s (%s) FROM STDIN" % (table, column_list)
+        self.logger.debug("Bulk insert into %s (%s)", table, column_list)
+
+        # Kept apart from the named queries in the metrics
+        label = "bulk:" + table
+        start = time.perf_counter()
+        total = chunks = 0
+        iterator = iter(rows)
+        try:
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                with TRACER.span("db.bulk_chunk", table=table, rows=len(chunk)):
+                    if self.dbtype == 'sqlite':
+                        self.cursor.executemany(sql, chunk)
+                    elif self.dbtype == 'mysql':
+                        self.cursor.execute(
+                            sql + ", ".join([marks] * len(chunk)),
+                            [v for row in chunk for v in row])
+                    else:
+                        import io
+                        data = io.StringIO("".join(
+                            "\t".join(_copy_value(v) for v in row) + "\n"
+                            for row in chunk))
+                        self.cursor.copy_expert(sql, data)
+                    if commit == 'chunk':
+                        self.connection.commit()
+                if self.result_cache is not None:
+                    self.result_cache.invalidate(table)
+                total += len(chunk)
+                chunks += 1
+            if commit == 'end':
+                self.connection.commit()
+        except Exception as e:
+            _query_errors.labels(label).inc()
+            self.logger.error("Bulk insert into %s failed after %d rows: %s",
+                              table, total, e)
+            if commit is not None:
+                self.rollback()
+            raise
+
+        seconds = time.perf_counter() - start
+        _query_seconds.labels(label).observe(seconds)
+        _query_rows.labels(label).inc(total)
+        rate = total / seconds if seconds > 0 else 0.0
+        self.logger.info("Inserted %d rows into %s in %.2fs (%.0f rows/s)",
+                         total, table, seconds, rate)
+
+        return {'rows': total, 'chunks': chunks, 'seconds': seconds,
+                'rows_per_second': rate}
+
     def commit(self):
         """
         Commit the current transaction.  This function should be called
@@ -227,7 +1008,7 @@ class ALXdatabase:
                 self.connection.close()
             if self.cursor:
                 self.cursor.close()
-        except (sqlite3.Error, Exception):
+        except Exception:
             pass
 
         self.cursor = None
@@ -246,5 +1027,238 @@ class ALXdatabase:
     def __del__(self):
         try:
             self.close()
-        except (sqlite3.Error, Exception):
+        except Exception:
             pass
+
+
+class ALXdatabasePool:
+    def __init__(self, dbtype: str = 'mysql', user: str = None,
+                 password: str = None, host: str = 'localhost', database: str = None,
+                 port: int = 3306, autocommit: bool = False,
+                 min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 max_age: float = 3600.0, check: bool = True,
+                 row_factory: str = 'tuple') -> None:
+        """
+        A thread safe pool of `ALXdatabase` connections for threaded and
+        long running jobs, so each unit of work does not pay for a new
+        connection.  The connection parameters are those of `ALXdatabase`.
+        ```
+        pool = ALXdatabasePool(dbtype='postgres', user=app.user,
+                               password=app.password, database='metrics',
+                               max_size=8)
+        with pool.connection() as db:
+            rows = db.run("SELECT host, value FROM samples WHERE host = %s",
+                          params=(host,))
+        # <-- committed and returned, or rolled back if an error occurred
+        ```
+        A connection is checked with `SELECT 1` before it is lent out and
+        replaced if that fails.  Connections older than `max_age` are
+        closed rather than reused.  Uncommitted work is rolled back when
+        a connection is returned.
+
+        Each SQLite connection opens the file separately, so a pool of
+        `:memory:` databases does not share any data.
+
+        :param min_size: The number of connections opened straight away
+        :param max_size: The maximum number of connections open at once
+        :param timeout: Seconds `acquire` waits for a connection when
+         `max_size` are in use before raising `TimeoutError`
+        :param max_age: Seconds after which a connection is closed and
+         replaced. `0` keeps them forever
+        :param check: Whether to check a connection before lending it
+        :param row_factory: The `ALXdatabase.set_row_factory` of the connections
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must be 0 <= min_size <= max_size "
+                             "and max_size >= 1")
+        self.logger = ALXapp.logger
+        """The default logger from `alx.app.ALXapp.logger`"""
+        self.min_size = min_size
+        """The number of connections opened when the pool is created"""
+        self.max_size = max_size
+        """The maximum number of connections open at once"""
+        self.timeout = timeout
+        """Seconds to wait for a free connection"""
+        self.max_age = max_age
+        """Seconds after which a connection is replaced"""
+        self.check = check
+        """Whether connections are checked before being lent out"""
+        self._params = {'dbtype': dbtype, 'user': user, 'password': password,
+                        'host': host, 'database': database, 'port': port,
+                        'autocommit': autocommit, 'row_factory': row_factory}
+        self._idle = []
+        self._created = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {'created': 0, 'closed': 0, 'checkouts': 0,
+                       'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+                       'failed_checks': 0}
+
+        for _ in range(min_size):
+            with self._condition:
+                self._size += 1
+            self._release(self._create())
+
+    def _create(self) -> ALXdatabase:
+        # Called with a slot already counted in `_size`
+        try:
+            db = ALXdatabase(**self._params)
+            if db.dbtype == 'sqlite':
+                # Lent to one thread at a time, not always the one that
+                # opened it
+                db._sqlite_options = {'check_same_thread': False}
+            db.connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created[id(db)] = time.monotonic()
+            self._stats['created'] += 1
+        return db
+
+    def _discard(self, db: ALXdatabase) -> None:
+        db.close()
+        with self._condition:
+            self._created.pop(id(db), None)
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._condition.notify()
+
+    def _expired(self, db: ALXdatabase) -> bool:
+        return (self.max_age > 0 and
+                time.monotonic() - self._created.get(id(db), 0) > self.max_age)
+
+    def _alive(self, db: ALXdatabase) -> bool:
+        try:
+            db.cursor.execute("SELECT 1")
+            db.cursor.fetchall()
+            return True
+        except Exception as e:
+            self.logger.warning("Pooled connection failed check: %s", e)
+            with self._condition:
+                self._stats['failed_checks'] += 1
+            return False
+
+    def acquire(self, timeout: float = None) -> ALXdatabase:
+        """
+        Borrow a connection.  It must be given back with `release`;
+        `connection` does both.
+
+        :param timeout: Seconds to wait if all connections are in use.
+         Default is `timeout` of the pool
+        :return: A connected `ALXdatabase`
+        :raises TimeoutError: If no connection became free in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            db = None
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("The pool is closed")
+                waited = None
+                while not self._idle and self._size >= self.max_size:
+                    now = time.monotonic()
+                    if waited is None:
+                        waited = now
+                        self._stats['waits'] += 1
+                    if now >= deadline:
+                        self._stats['timeouts'] += 1
+                        self._stats['wait_seconds'] += now - waited
+                        raise TimeoutError("No database connection free after "
+                                           "%.1f seconds" % timeout)
+                    self._condition.wait(deadline - now)
+                if waited is not None:
+                    self._stats['wait_seconds'] += time.monotonic() - waited
+                if self._idle:
+                    db = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if db is None:
+                db = self._create()
+            elif self._expired(db) or (self.check and not self._alive(db)):
+                self._discard(db)
+                continue
+
+            with self._condition:
+                self._stats['checkouts'] += 1
+            return db
+
+    def release(self, db: ALXdatabase) -> None:
+        """
+        Give back a connection borrowed with `acquire`.  Uncommitted work is
+        rolled back.
+
+        :param db: The connection
+        """
+        try:
+            db.rollback()
+        except Exception:
+            # Closed or broken, it is replaced on the next `acquire`
+            self._discard(db)
+            return
+        self._release(db)
+
+    def _release(self, db: ALXdatabase) -> None:
+        if self._closed or db.connection is None or self._expired(db):
+            self._discard(db)
+            return
+        with self._condition:
+            self._idle.append(db)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        Borrow a connection for the block.  It is committed if the block
+        succeeds, rolled back if not, and returned to the pool
+
+        :param timeout: Seconds to wait for a free connection
+        """
+        db = self.acquire(timeout)
+        try:
+            yield db
+            db.commit()
+        except BaseException:
+            try:
+                db.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.release(db)
+
+    def stats(self) -> dict:
+        """
+        :return: A dict of `size` (open connections), `in_use`, `idle`,
+         `created`, `closed`, `checkouts`, `waits` (checkouts that had to
+         wait), `wait_seconds`, `timeouts` and `failed_checks`
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+        return stats
+
+    def close(self) -> None:
+        """
+        Close the idle connections.  Connections still in use are closed
+        when they are released.
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for db in idle:
+            self._discard(db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -6,8 +6,13 @@
 # the ALXhtml class for composing text and HTML-based email messages.
 
 from alx.app import ALXapp
+from alx.metrics import REGISTRY
+from alx.trace import traced
 from typing import Any
 
+_html_bytes = REGISTRY.counter(
+    "alx_html_bytes_total", "Bytes of UTF-8 HTML rendered by get_html")
+
 
 class ALXhtml:
     def __init__(self, title: str = None) -> None:
@@ -352,6 +357,7 @@ class ALXhtml:
             text = target
         self.body += "<a href='%s'>%s</a>\n" % (target, text)
 
+    @traced("html.render")
     def get_html(self) -> str:
         """
         Put all the elements together and return a formatted HTML document
@@ -366,5 +372,6 @@ class ALXhtml:
         value += self.body
         value += "</body>\n"
         value += "</html>\n"
+        _html_bytes.inc(len(value.encode()))
 
         return value
@@ -0,0 +1,92 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# A thin client for alx.itrs.daemon.ActionServer.  It forwards the
+# arguments and the Geneos environment of an action to the daemon and
+# exits without importing the rest of alx.  Use it as the Geneos action
+# script:
+#
+#     python -m alx.itrs.client itrs_email user@example.com
+#
+# where `itrs_email` is the name the daemon was started with.
+
+import os
+import sys
+import json
+import socket
+import platform
+
+ATTRIBUTES = ("location", "application", "environment")
+"""Environment variables forwarded as well as those starting with `_`:
+the managed entity attributes read by `alx.itrs.environment.Environment`"""
+
+
+def socket_path(name: str) -> str:
+    """
+    The Unix domain socket used by the daemon called `name`:
+    `~/.config/alx/<name>.sock`
+
+    :param name: The daemon name
+    :return: The path to the socket
+    """
+    if platform.system() == "Windows":
+        directory = os.path.join(os.environ['APPDATA'], "alx")
+    else:
+        directory = os.path.join(os.path.expanduser("~"), ".config", "alx")
+    return os.path.join(directory, name + ".sock")
+
+
+def send_action(path: str, argv: list, environ: dict = None,
+                timeout: float = 5.0) -> bool:
+    """
+    Send an action to a daemon and wait only for it to be queued
+
+    :param path: The socket of the daemon
+    :param argv: The action arguments, without the program name
+    :param environ: The environment to take the Geneos variables from.
+     Default is `os.environ`
+    :param timeout: Seconds to wait for the daemon to accept the action
+    :return: True if the daemon queued the action
+    """
+    if environ is None:
+        environ = os.environ
+    env = {k: v for k, v in environ.items()
+           if k.startswith("_") or k in ATTRIBUTES}
+    message = json.dumps({"argv": list(argv), "env": env}) + "\n"
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(message.encode())
+        s.shutdown(socket.SHUT_WR)
+        reply = s.recv(64)
+
+    return reply.startswith(b"OK")
+
+
+def main(argv: list = None) -> int:
+    """
+    `python -m alx.itrs.client <name> [args...]`
+
+    :param argv: The arguments, default is `sys.argv[1:]`
+    :return: The exit status: 0 if queued, 1 otherwise
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: python -m alx.itrs.client <name> [args...]",
+              file=sys.stderr)
+        return 2
+
+    path = socket_path(argv[0])
+    try:
+        if send_action(path, argv[1:]):
+            return 0
+        print("%s: action rejected" % path, file=sys.stderr)
+    except OSError as e:
+        print("%s: %s" % (path, e), file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
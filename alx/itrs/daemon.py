@@ -0,0 +1,206 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# A resident server for ITRS Geneos actions.  Starting python, importing
+# alx and initialising ALXapp for every alert is slow, so the daemon does
+# it once and handles actions forwarded by alx.itrs.client over a Unix
+# domain socket.  Configuration, keys and smtp connections stay warm
+# between alerts.
+
+import os
+import json
+import signal
+import socket
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from alx.app import ALXapp
+from alx.mail import ALXmail, SMTPPool
+from alx.itrs.alert import HtmlAlert
+from alx.itrs.client import socket_path
+from alx.itrs.environment import Environment
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    MAX_MESSAGE = 1024 * 1024
+
+    def handle(self) -> None:
+        server = self.server.action_server
+        try:
+            message = json.loads(self.rfile.readline(self.MAX_MESSAGE))
+            argv = [str(a) for a in message["argv"]]
+            env = {str(k): str(v) for k, v in message["env"].items()}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            server.app.logger.error("Invalid action message: %s", e)
+            self.wfile.write(b"ERROR\n")
+            return
+
+        server.submit(argv, env)
+        self.wfile.write(b"OK\n")
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ActionServer:
+    def __init__(self, app: ALXapp, handler: Callable, path: str = None,
+                 workers: int = 4) -> None:
+        """
+        Listen on a Unix domain socket for actions sent by
+        `alx.itrs.client` and run `handler` for each on a pool of worker
+        threads.  The client gets a reply as soon as the action is queued.
+        ```
+        app = ALXapp("Geneos email daemon")
+        server = ActionServer(app, EmailAction(app))
+        server.serve_forever()
+        ```
+        The Geneos action then runs `python -m alx.itrs.client <app.name> ...`.
+
+        The socket is only accessible by the user running the daemon.
+
+        :param app: The application running the daemon
+        :param handler: Called as `handler(argv, environment)` where `argv`
+         is the list of client arguments and `environment` is an
+         `alx.itrs.environment.Environment` built from the client's
+         Geneos variables
+        :param path: The socket.  Default is `alx.itrs.client.socket_path`
+         of the app name
+        :param workers: The number of actions run at the same time
+        """
+        self.app = app
+        """The application running the daemon"""
+        self.handler = handler
+        """The function run for each action"""
+        self.path = path or socket_path(app.name)
+        """The Unix domain socket"""
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="alx-action")
+        """The workers running the actions"""
+        self._server = None
+
+    def submit(self, argv: list, env: dict) -> None:
+        """
+        Queue an action as if it had been received from a client
+
+        :param argv: The action arguments
+        :param env: The Geneos environment variables
+        """
+        self.executor.submit(self._run, argv, env)
+
+    def _run(self, argv: list, env: dict) -> None:
+        try:
+            self.handler(argv, Environment(env))
+        except Exception:
+            self.app.logger.exception("Action %s failed", argv)
+
+    def _bind(self) -> None:
+        if os.path.exists(self.path):
+            # Only remove the socket if nothing is listening on it
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect(self.path)
+                    raise RuntimeError("%s is already in use" % self.path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    os.remove(self.path)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _UnixServer(self.path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.action_server = self
+
+    def serve_forever(self, ready: threading.Event = None) -> None:
+        """
+        Handle actions until `shutdown` is called or, when run in the main
+        thread, SIGTERM or SIGINT is received.  Queued actions are
+        finished before returning.
+
+        :param ready: Optionally set once the socket is listening
+        """
+        self._bind()
+        if ready:
+            ready.set()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: threading.Thread(
+                    target=self.shutdown, daemon=True).start())
+
+        self.app.logger.info("Listening for actions on %s", self.path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.executor.shutdown(wait=True)
+            self.app.logger.info("Stopped listening on %s", self.path)
+
+    def start(self) -> threading.Thread:
+        """
+        Run `serve_forever` on a background thread
+
+        :return: The thread
+        """
+        ready = threading.Event()
+        thread = threading.Thread(target=self.serve_forever, args=(ready,),
+                                  name="alx-action-server", daemon=True)
+        thread.start()
+        ready.wait(5)
+        return thread
+
+    def shutdown(self) -> None:
+        """
+        Stop accepting actions.  `serve_forever` returns once the queued
+        actions are finished.
+        """
+        if self._server:
+            self._server.shutdown()
+
+
+class EmailAction:
+    def __init__(self, app: ALXapp, pool: SMTPPool = None) -> None:
+        """
+        An `ActionServer` handler that emails the alert to the recipients
+        given as arguments, as in `examples/scripts/itrs_email`.  The smtp
+        connections are kept in an `alx.mail.SMTPPool`.
+
+        :param app: The application.  `app.sender` is used as the sender
+         if it is configured
+        :param pool: The smtp connection pool. A new one is created by default
+        """
+        self.app = app
+        """The application running the daemon"""
+        self.pool = pool or SMTPPool()
+        """The smtp connections shared by all actions"""
+
+    def subject(self, e: Environment) -> str:
+        """
+        :param e: The alert environment
+        :return: The email subject
+        """
+        return ("%s: %s - %s %s %s is %s" %
+                (e.severity.title(), e.managed_entity, e.sampler,
+                 e.rowname, e.column, e.value))
+
+    def __call__(self, argv: list, environment: Environment) -> None:
+        if not argv:
+            return
+
+        mail = ALXmail()
+        mail.set_smtp_pool(self.pool)
+        if hasattr(self.app, 'sender'):
+            mail.set_from(self.app.sender)
+        # Recipients may also be comma separated within an argument
+        mail.set_recipients(" ".join(argv))
+        mail.set_subject(self.subject(environment))
+        mail.add_html(HtmlAlert(environment).create())
+
+        self.app.logger.info("Sending %s to %s", mail.subject, argv)
+        mail.send()
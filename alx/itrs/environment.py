@@ -15,111 +15,115 @@ import os
 
 
 class Environment:
-    def __init__(self):
+    def __init__(self, environ: dict = None):
         """
         Populate the `Environment` object with commonly found
         environment variables from [ITRS geneos actions](https://docs.itrsgroup.com/docs/geneos/7.2.0/processing/monitoring-and-alerts/geneos_rulesactionsalerts_tr/index.html#script-actions).
         Useful when writing actions and triggers.  Please refer to the
         source code to see what is set.
+
+        :param environ: The variables to use instead of `os.environ`, for
+         example those forwarded to a `alx.itrs.daemon.ActionServer`
         """
+        env = os.environ if environ is None else environ
 
-        self.location = os.getenv("location")
+        self.location = env.get("location")
         """The value of the environment variable `location` - the `location` attribute"""
-        self.application = os.getenv("application")
+        self.application = env.get("application")
         """The value of the environment variable `application` - the `application` attribute"""
-        self.environment = os.getenv("environment")
+        self.environment = env.get("environment")
         """The value of the environment variable `environment` - the `environment` attribute"""
-        self.variable = os.getenv("_VARIABLE")
+        self.variable = env.get("_VARIABLE")
         """The value of the environment variable `_VARIABLE` - Short name of the data-item
         if it is a managed variable, in the form <!>name for headlines or row.col for table
          ells. This value is provided for backwards compatibility."""
-        self.action = os.getenv("_ACTION")
+        self.action = env.get("_ACTION")
         """The value of the environment variable `_ACTION` - The name of the action being triggered"""
-        self.value = os.getenv("_VALUE")
+        self.value = env.get("_VALUE")
         """The value of the environment variable `_VALUE` -
         The value of the dataview cell the data-item belongs to (if any)."""
-        self.managed_entity = os.getenv("_MANAGED_ENTITY")
+        self.managed_entity = env.get("_MANAGED_ENTITY")
         """The value of the environment variable `_MANAGED_ENTITY` -
         The name of the managed entity the data-item belongs to (if any)."""
-        self.sampler = os.getenv("_SAMPLER")
+        self.sampler = env.get("_SAMPLER")
         """The value of the environment variable `_SAMPLER` -
         The name of the sampler the data-item belongs to (if any)."""
-        self.sampler_type = os.getenv("_SAMPLER_TYPE")
+        self.sampler_type = env.get("_SAMPLER_TYPE")
         """The value of the environment variable `_SAMPLER_TYPE` -
         The type of the sampler the data-item belongs to (if any)."""
-        self.sampler_group = os.getenv("_SAMPLER_GROUP")
+        self.sampler_group = env.get("_SAMPLER_GROUP")
         """The value of the environment variable `_SAMPLER_GROUP` -
         The group of the sampler the data-item belongs to (if any)."""
-        self.gateway = os.getenv("_GATEWAY")
+        self.gateway = env.get("_GATEWAY")
         """The value of the environment variable `_GATEWAY` - 
         The name of the gateway firing the action."""
-        self.rowname = os.getenv("_ROWNAME")
+        self.rowname = env.get("_ROWNAME")
         """The value of the environment variable `_ROWNAME` - 
         The row name of the dataview cell the data-item belongs to (if any).  
         If it is a headline variable, then it is set to `_HEADLINE`"""
         if not self.rowname:
-            self.rowname = os.getenv("_HEADLINE")
+            self.rowname = env.get("_HEADLINE")
             self.headline = self.rowname
-        self.column = os.getenv("_COLUMN")
+        self.column = env.get("_COLUMN")
         """The value of the environment variable `_COLUMN` -
         The column name of the dataview cell the data-item belongs to (if any)."""
-        self.first_column = os.getenv("_FIRSTCOLUMN")
+        self.first_column = env.get("_FIRSTCOLUMN")
         """The value of the environment variable `_FIRSTCOLUMN` - 
         The name of the first column of the dataview the data-item belongs to (if any)."""
-        self.dataview = os.getenv("_DATAVIEW")
+        self.dataview = env.get("_DATAVIEW")
         """The value of the environment variable `_DATAVIEW` - 
         The name of the dataview the data-item belongs to (if any)."""
-        self.plugin_name = os.getenv("_PLUGINNAME")
+        self.plugin_name = env.get("_PLUGINNAME")
         """The value of the environment variable `_PLUGINNAME` -
         The plugin name of the sampler the data-item belongs to (if any)."""
-        self.rule = os.getenv("_RULE")
+        self.rule = env.get("_RULE")
         """The value of the environment variable `_RULE` -
         The rule that triggered this action. This is the full path 
         to the rule including the rule groups i.e. group1 > group 2 > rulename"""
-        self.host = os.getenv("_NETPROBE_HOST")
+        self.host = env.get("_NETPROBE_HOST")
         """The value of the environment variable `_NETPROBE_HOST` -
         The hostname of the probe the data-item belongs to (if any). """
-        self.netprobe_host = os.getenv("_NETPROBE_HOST")
+        self.netprobe_host = env.get("_NETPROBE_HOST")
         """The value of the environment variable `_NETPROBE_HOST` -
         The hostname of the probe the data-item belongs to (if any). """
-        self.probe = os.getenv("_PROBE")
+        self.probe = env.get("_PROBE")
         """The value of the environment variable `_PROBE` -
         The name of the probe the data-item belongs to (if any)."""
-        self.kba_urls = os.getenv("_KBA_URLS")
+        self.kba_urls = env.get("_KBA_URLS")
         """The value of the environment variable `_KBA_URLS` -
         A list of application knowledge base article URLs, separated by newlines."""
-        self.severity = os.getenv("_SEVERITY") or "critical"
+        self.severity = env.get("_SEVERITY") or "critical"
         """The value of the environment variable `_SEVERITY` -
         The data-item severity. One of UNDEFINED, OK, WARNING, CRITICAL or USER.
         Converted to lower case"""
         self.severity = self.severity.lower()
-        self.path = os.getenv("_VARIABLEPATH")
+        self.path = env.get("_VARIABLEPATH")
         """The value of the environment variable `_VARIABLEPATH` - The full gateway path 
         to the data-item."""
-        self.variablepath = os.getenv("_VARIABLEPATH")
+        self.variablepath = env.get("_VARIABLEPATH")
         """The value of the environment variable `_VARIABLEPATH` - The full gateway path 
         to the data-item."""
-        self.assignee_email = os.getenv("_ASSIGNEE_EMAIL")
+        self.assignee_email = env.get("_ASSIGNEE_EMAIL")
         """The value of the environment variable `_ASSIGNEE_EMAIL` -
         Name of the Geneos user assigned this item. The name is taken 
         from the user definition in the authentication section."""
-        self.assignee_name = os.getenv("_ASSIGNEE_USERNAME")
+        self.assignee_name = env.get("_ASSIGNEE_USERNAME")
         """The value of the environment variable `_ASSIGNEE_USERNAME` -
         Email address of the Geneos user assigned this item. The address is taken from
         the user definition in the authentication section."""
-        self.assigner_name = os.getenv("_ASSIGNER_USERNAME")
+        self.assigner_name = env.get("_ASSIGNER_USERNAME")
         """The value of the environment variable `_ASSIGNER_USERNAME` -
         Name of the Geneos user assigning this item to another. The name is taken from
         the user definition in the authentication section."""
-        self.comment = os.getenv("_COMMENT")
+        self.comment = env.get("_COMMENT")
         """The value of the environment variable `_COMMENT` -
         Comment entered by the assigner or the user who unassigned the item. If no 
         comment is provided, this variable is set to a blank string ("")."""
-        self.previous_comment = os.getenv("_PREVIOUS_COMMENT")
+        self.previous_comment = env.get("_PREVIOUS_COMMENT")
         """The value of the environment variable `_PREVIOUS_COMMENT` -
         Contents of the _COMMENT environment variable from the previous 
         assign/unassign event. """
-        self.period_type = os.getenv("_PERIOD_TYPE")
+        self.period_type = env.get("_PERIOD_TYPE")
         """The value of the environment variable `_PERIOD_TYPE` - 
         Period for which the item is assigned:
         * **Manual** — Assigned to the user until unassigned.
@@ -136,10 +140,10 @@ class Environment:
         letter"""
         # Pull out all the columns from the dataview (only works if starts
         # with '_' and contains a lowercase letter
-        for e in sorted(os.environ):
+        for e in sorted(env):
             if not e.startswith("_"):
                 continue
             if e[1:] == self.first_column:
                 continue
             if any(c for c in e if c.islower()):
-                self.dataview_columns[e[1:]] = os.environ[e]
+                self.dataview_columns[e[1:]] = env[e]
@@ -7,6 +7,12 @@
 
 from collections import OrderedDict
 import sys
+from alx.metrics import REGISTRY
+
+_displays = REGISTRY.counter(
+    "alx_toolkit_displays_total", "Toolkit samplers output")
+_rows = REGISTRY.gauge(
+    "alx_toolkit_rows", "Rows in the last toolkit sampler output")
 
 
 class Toolkit:
@@ -120,6 +126,9 @@ class Toolkit:
         if not self._display_on_exit:
             return
 
+        _displays.inc()
+        _rows.set(self.num_rows)
+
         if self._filename:
             fp = open(self._filename, "w")
         else:
@@ -0,0 +1,236 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# Logging handlers used by ALXapp.start_logging.  The queue handler and
+# listener move file and console I/O off the thread doing the logging.
+# The rotating file handler rolls on time or size and compresses the
+# rolled files on a background thread.
+
+import os
+import queue
+import time
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue, block: bool = False) -> None:
+        """
+        A `QueueHandler` for a bounded queue.  When the queue is full the
+        record is either dropped or the caller waits for space, depending
+        on `block`
+
+        :param log_queue: The queue shared with the `BlockingQueueListener`
+        :param block: If True, wait for space in the queue.  Otherwise the
+         record is dropped and counted in `dropped`
+        """
+        super().__init__(log_queue)
+        self.block = block
+        """Whether to wait when the queue is full"""
+        self.dropped = 0
+        """The number of records dropped because the queue was full"""
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class BlockingQueueListener(QueueListener):
+    """
+    A `QueueListener` that waits for space to queue its stop sentinel so
+    `stop` works on a full bounded queue.  All records queued before
+    `stop` is called are handled before it returns.
+    """
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+class Compressor:
+    SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+    """The file suffix for each supported compression"""
+
+    def __init__(self, method: str) -> None:
+        """
+        Compress files on a single background thread so the thread doing
+        the logging never waits for it.  The original file is only removed
+        once the compressed copy is complete.
+
+        :param method: `gzip` or `zstd`.  `zstd` needs `pip install zstandard`
+        :raises ValueError: If the method is unknown
+        :raises RuntimeError: If `zstd` is requested but not installed
+        """
+        if method not in self.SUFFIXES:
+            raise ValueError("Unsupported compression '%s', use one of %s"
+                             % (method, ", ".join(self.SUFFIXES)))
+        if method == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise RuntimeError("zstd support not available, install zstandard")
+
+        self.method = method
+        """The compression method"""
+        self.suffix = self.SUFFIXES[method]
+        """The suffix added to compressed files"""
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str) -> None:
+        """
+        Queue `filename` for compression, starting the worker if needed
+
+        :param filename: The file to compress
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name="alx-log-compress",
+                                                daemon=True)
+                self._thread.start()
+        self._queue.put(filename)
+
+    def join(self) -> None:
+        """
+        Wait until all queued files have been compressed
+        """
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            filename = self._queue.get()
+            try:
+                self.compress(filename)
+            except Exception:
+                # Leave the uncompressed file in place
+                pass
+            finally:
+                self._queue.task_done()
+
+    def compress(self, filename: str) -> str:
+        """
+        Compress `filename` in the calling thread, keeping its modification time
+
+        :param filename: The file to compress
+        :return: The name of the compressed file
+        """
+        target = filename + self.suffix
+        tmp = target + ".tmp"
+        st = os.stat(filename)
+        with open(filename, 'rb') as src:
+            if self.method == 'gzip':
+                import gzip
+                import shutil
+                with gzip.open(tmp, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                import zstandard
+                with open(tmp, 'wb') as dst:
+                    zstandard.ZstdCompressor().copy_stream(src, dst)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, target)
+        os.remove(filename)
+
+        return target
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    def __init__(self, filename: str, when: str = 'midnight', days: int = 7,
+                 max_bytes: int = 0, compress: str = None,
+                 encoding: str = None, delay: bool = False) -> None:
+        """
+        A `TimedRotatingFileHandler` that also rolls the file once it
+        reaches `max_bytes`, whichever comes first.  Several files rolled
+        in one period get a counter: `app.log.2025-01-01`,
+        `app.log.2025-01-01.1`, ...
+
+        Rolled files can be compressed on a background thread and rolled
+        files older than `days` days are removed.
+
+        :param filename: The log file
+        :param when: When to roll the file, as for `TimedRotatingFileHandler`
+        :param days: The number of days to keep rolled files
+        :param max_bytes: Roll the file when it reaches this size.  0 disables
+        :param compress: `gzip`, `zstd` or None to leave files uncompressed
+        :param encoding: The file encoding
+        :param delay: Defer opening the file until the first record
+        """
+        super().__init__(filename, when=when, backupCount=days,
+                         encoding=encoding, delay=delay)
+        self.days = days
+        """Rolled files older than this number of days are removed"""
+        self.max_bytes = max_bytes
+        """The size at which the file is rolled"""
+        self.compressor = None
+        """The `Compressor` for rolled files"""
+        if compress and compress != 'none':
+            self.compressor = Compressor(compress)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            # Checking the size already written avoids formatting every
+            # record twice.  The file may exceed max_bytes by one record
+            if self.stream.tell() >= self.max_bytes:
+                return True
+        return False
+
+    def rotation_filename(self, default_name: str) -> str:
+        name = super().rotation_filename(default_name)
+        suffix = self.compressor.suffix if self.compressor else ""
+        candidate = name
+        count = 0
+        while os.path.exists(candidate) or os.path.exists(candidate + suffix):
+            count += 1
+            candidate = "%s.%d" % (name, count)
+        return candidate
+
+    def rotate(self, source: str, dest: str) -> None:
+        super().rotate(source, dest)
+        if self.compressor and os.path.exists(dest):
+            self.compressor.submit(dest)
+
+    def getFilesToDelete(self) -> list:
+        """
+        :return: Rolled files, compressed or not, last modified more
+         than `days` days ago
+        """
+        dirname, basename = os.path.split(self.baseFilename)
+        prefix = basename + "."
+        cutoff = time.time() - self.days * 86400
+        result = []
+        for name in os.listdir(dirname):
+            if not name.startswith(prefix) or name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirname, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    result.append(path)
+            except OSError:
+                pass
+        return result
+
+    def close(self) -> None:
+        super().close()
+        if self.compressor:
+            self.compressor.join()
@@ -25,6 +25,120 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import Union
 import ssl
+import threading
+import time
+from contextlib import contextmanager
+from alx.metrics import REGISTRY
+from alx.trace import TRACER, traced
+
+_send_seconds = REGISTRY.histogram(
+    "alx_mail_send_seconds", "Time to send an email including retries")
+_send_attempts = REGISTRY.counter(
+    "alx_mail_attempts_total", "Attempts to send an email to the smtp server")
+_send_failures = REGISTRY.counter(
+    "alx_mail_failures_total", "Emails not sent after all retries")
+
+
+class SMTPPool:
+    def __init__(self, max_idle: int = 4, idle_timeout: float = 60.0) -> None:
+        """
+        Keeps SMTP connections open between calls to `ALXmail.send` so a
+        long running process does not connect, STARTTLS and log in for
+        every message.  Connections are kept per server, port, tls and
+        user.  A connection is checked with `NOOP` before it is reused and
+        is dropped if it has been idle for longer than `idle_timeout`.
+
+        Short lived scripts gain nothing from a pool.  It is intended for
+        daemons such as `alx.itrs.daemon.ActionServer`:
+        ```
+        pool = SMTPPool()
+        mail = ALXmail()
+        mail.set_smtp_pool(pool)
+        ...
+        mail.send()
+        ```
+
+        :param max_idle: The maximum idle connections kept per server
+        :param idle_timeout: Idle connections older than this many
+         seconds are closed rather than reused
+        """
+        self.max_idle = max_idle
+        """The maximum idle connections kept per server"""
+        self.idle_timeout = idle_timeout
+        """Seconds after which an idle connection is closed"""
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(mail: "ALXmail") -> tuple:
+        return (mail.mailhost, mail.smtp_port, mail.smtp_use_tls,
+                mail.smtp_tls_verify, mail.smtp_user)
+
+    @contextmanager
+    def connection(self, mail: "ALXmail"):
+        """
+        Borrow a connection for the server configured in `mail`, making a
+        new one if none is idle.  The connection is returned to the pool
+        if the block succeeds and closed otherwise.
+
+        :param mail: The `ALXmail` holding the server settings
+        """
+        key = self._key(mail)
+        server = None
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle and server is None:
+                candidate, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    server = candidate
+                else:
+                    self._close(candidate)
+
+        if server is not None:
+            try:
+                if server.noop()[0] != 250:
+                    raise SMTPServerDisconnected("NOOP failed")
+            except Exception:
+                self._close(server)
+                server = None
+
+        if server is None:
+            server = mail._connect()
+
+        try:
+            yield server
+        except BaseException:
+            self._close(server)
+            raise
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((server, time.monotonic()))
+                server = None
+        if server is not None:
+            self._close(server)
+
+    def close(self) -> None:
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle = [s for servers in self._idle.values() for s, _ in servers]
+            self._idle.clear()
+        for server in idle:
+            self._close(server)
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
 
 
 class ALXmail(ALXhtml):
@@ -85,6 +199,8 @@ class ALXmail(ALXhtml):
         """A list of those on the bcc list"""
         self.attachments = []
         """A list of attachments"""
+        self.smtp_pool = None
+        """An optional `SMTPPool` from which connections are borrowed"""
 
     def set_from(self, sender: str) -> None:
         """
@@ -172,6 +288,7 @@ class ALXmail(ALXhtml):
         """
         self.add_paragraph(t)
 
+    @traced("mail.attachment")
     def add_attachment(self, filename: str) -> str:
         """
         Adds a file as an attachment. If an image, it will be displayed
@@ -298,6 +415,34 @@ class ALXmail(ALXhtml):
         """
         self.smtp_timeout = timeout
 
+    def set_smtp_pool(self, pool: SMTPPool) -> None:
+        """
+        Reuse connections from `pool` in `send` instead of connecting for
+        every message
+
+        :param pool: The `SMTPPool`, or None to connect for each message
+        """
+        self.smtp_pool = pool
+
+    def _connect(self) -> smtplib.SMTP:
+        """
+        Connect to the smtp server, starting TLS and logging in as configured.
+        Each step is traced separately to show which is slow
+
+        :return: The connected `smtplib.SMTP`
+        """
+        with TRACER.span("smtp.connect", host=self.mailhost):
+            server = smtplib.SMTP(self.mailhost, self.smtp_port,
+                                  timeout=self.smtp_timeout)
+        if self.smtp_use_tls:
+            with TRACER.span("smtp.starttls"):
+                server.starttls(context=self._tls_context())
+        if self.smtp_user:
+            with TRACER.span("smtp.login"):
+                server.login(self.smtp_user, self.smtp_password)
+        return server
+
+    @traced("mail.send")
     def send(self) -> None:
         """
         Sends the message. It firsts constructs the email message
@@ -307,6 +452,9 @@ class ALXmail(ALXhtml):
         or mailhost glitch. If the number of attempts is exceeded,
         the corresponding exception is thrown. The SMTP host to use is
         configured in `alx.ini`. As are retries and delay.
+
+        If an `SMTPPool` has been set with `set_smtp_pool`, the connection
+        is borrowed from the pool and returned to it afterwards.
         """
         self.message["From"] = self.sender
         self.message["Subject"] = self.subject
@@ -333,17 +481,23 @@ class ALXmail(ALXhtml):
             self.message.set_content(body)
 
         count = 0
+        start = time.perf_counter()
 
         while count < self.smtp_retries:
+            _send_attempts.inc()
             try:
-                self.server = smtplib.SMTP(self.mailhost, self.smtp_port,
-                                           timeout=self.smtp_timeout)
-                if self.smtp_use_tls:
-                    self.server.starttls(context=self._tls_context())
-                if self.smtp_user:
-                    self.server.login(self.smtp_user, self.smtp_password)
-                self.server.send_message(self.message)
-                self.server.quit()
+                if self.smtp_pool:
+                    with self.smtp_pool.connection(self) as server:
+                        self.server = server
+                        with TRACER.span("smtp.send", attempt=count + 1):
+                            server.send_message(self.message)
+                else:
+                    self.server = self._connect()
+                    with TRACER.span("smtp.send", attempt=count + 1):
+                        self.server.send_message(self.message)
+                    with TRACER.span("smtp.quit"):
+                        self.server.quit()
+                _send_seconds.observe(time.perf_counter() - start)
                 return
             except (socket.error, SMTPException, SMTPAuthenticationError,
                     SMTPConnectError, SMTPDataError, SMTPHeloError,
@@ -352,6 +506,7 @@ class ALXmail(ALXhtml):
                     SMTPServerDisconnected) as ex:
                 count += 1
                 if count == self.smtp_retries:
+                    _send_failures.inc()
                     raise
                 else:
                     sleep(self.smtp_delay)
@@ -0,0 +1,330 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# An in-process metrics registry with counters, gauges and fixed bucket
+# histograms.  alx records the performance of database queries, email,
+# html rendering and toolkit output in the default registry.  It can be
+# exported as a Prometheus textfile or as an ITRS Geneos toolkit sampler.
+
+import os
+import math
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+"""The default histogram buckets, in seconds"""
+
+
+class _Child:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple) -> None:
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name: str, description: str = "",
+                 labelnames: tuple = ()) -> None:
+        """
+        The base of `Counter`, `Gauge` and `Histogram`.  A metric with
+        label names holds one value per set of label values, obtained
+        with `labels`.  A metric without labels is used directly.
+
+        :param name: The metric name, for example `alx_db_query_seconds`
+        :param description: The help text
+        :param labelnames: The names of the labels
+        """
+        self.name = name
+        """The metric name"""
+        self.description = description
+        """The help text"""
+        self.labelnames = tuple(labelnames)
+        """The names of the labels"""
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _Child()
+
+    def labels(self, *values):
+        """
+        :param values: The label values in the order of `labelnames`
+        :return: The value holder for these label values
+        """
+        try:
+            return self._children[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s expects labels %s" % (self.name,
+                                                           self.labelnames))
+            with self._lock:
+                return self._children.setdefault(values, self._new_child())
+
+    def samples(self) -> list:
+        """
+        :return: A list of `(label values, value holder)`
+        """
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increase a counter without labels
+
+        :param amount: The amount to add
+        """
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increase a gauge without labels
+
+        :param amount: The amount to add
+        """
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        """
+        Decrease a gauge without labels
+
+        :param amount: The amount to subtract
+        """
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        """
+        Set a gauge without labels
+
+        :param value: The new value
+        """
+        self._default.set(value)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, description: str = "",
+                 labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        """
+        Counts observations in fixed buckets.  Recording a value is a
+        binary search and three additions.
+
+        :param name: The metric name
+        :param description: The help text
+        :param labelnames: The names of the labels
+        :param buckets: The upper bounds of the buckets, in increasing order
+        """
+        self.buckets = tuple(sorted(buckets))
+        """The upper bounds of the buckets"""
+        super().__init__(name, description, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value in a histogram without labels
+
+        :param value: The value
+        """
+        self._default.observe(value)
+
+
+class Registry:
+    def __init__(self) -> None:
+        """
+        A set of metrics, looked up by name.  The `counter`, `gauge` and
+        `histogram` methods return the existing metric if it has already
+        been created so modules can declare the metrics they use at
+        import time.
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls: type, name: str, *args, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError("%s is already a %s" % (name, metric.TYPE))
+            return metric
+
+    def counter(self, name: str, description: str = "",
+                labelnames: tuple = ()) -> Counter:
+        """
+        :return: The `Counter` called `name`, created if needed
+        """
+        return self._get(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str = "",
+              labelnames: tuple = ()) -> Gauge:
+        """
+        :return: The `Gauge` called `name`, created if needed
+        """
+        return self._get(Gauge, name, description, labelnames)
+
+    def histogram(self, name: str, description: str = "",
+                  labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """
+        :return: The `Histogram` called `name`, created if needed
+        """
+        return self._get(Histogram, name, description, labelnames, buckets)
+
+    def metrics(self) -> list:
+        """
+        :return: All the metrics sorted by name
+        """
+        with self._lock:
+            return [self._metrics[k] for k in sorted(self._metrics)]
+
+    def clear(self) -> None:
+        """
+        Reset every value to zero, keeping the metrics
+        """
+        for metric in self.metrics():
+            with metric._lock:
+                metric._children.clear()
+            if not metric.labelnames:
+                metric._default = metric.labels()
+
+
+REGISTRY = Registry()
+"""The default registry used by alx"""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _number(value: float) -> str:
+    if not math.isfinite(value):
+        return "NaN" if math.isnan(value) else "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def prometheus_text(registry: Registry = REGISTRY) -> str:
+    """
+    Format the metrics in the Prometheus text exposition format
+
+    :param registry: The registry to export
+    :return: The text
+    """
+    lines = []
+    for metric in registry.metrics():
+        lines.append("# HELP %s %s" % (metric.name, metric.description))
+        lines.append("# TYPE %s %s" % (metric.name, metric.TYPE))
+        for values, child in metric.samples():
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                bounds = metric.buckets + (float("inf"),)
+                for bound, count in zip(bounds, child.counts):
+                    cumulative += count
+                    le = 'le="%s"' % _number(bound)
+                    lines.append("%s_bucket%s %d" % (
+                        metric.name, _labels(metric.labelnames, values, le),
+                        cumulative))
+                label = _labels(metric.labelnames, values)
+                lines.append("%s_sum%s %s" % (metric.name, label, _number(child.sum)))
+                lines.append("%s_count%s %d" % (metric.name, label, child.count))
+            else:
+                lines.append("%s%s %s" % (metric.name,
+                                          _labels(metric.labelnames, values),
+                                          _number(child.value)))
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(filename: str, registry: Registry = REGISTRY) -> None:
+    """
+    Write the metrics to `filename` for the node_exporter textfile
+    collector.  The file is replaced atomically so a partial file is
+    never collected.
+
+    :param filename: The file to write, usually ending in `.prom`
+    :param registry: The registry to export
+    """
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(prometheus_text(registry))
+    os.replace(tmp, filename)
+
+
+def toolkit(filename: str = None, registry: Registry = REGISTRY):
+    """
+    Fill an `alx.itrs.toolkit.Toolkit` with one row per metric and set of
+    labels so Geneos can sample the health of the application.  For
+    histograms, `value` is the mean of the observations.
+
+    :param filename: Passed to `Toolkit`.  Default is `sys.stdout`
+    :param registry: The registry to export
+    :return: The `Toolkit`.  Call `ok` on it to output the sampler
+    """
+    from alx.itrs.toolkit import Toolkit
+
+    tk = Toolkit(filename)
+    tk.add_headings("metric,type,value,count,sum")
+    for metric in registry.metrics():
+        for values, child in metric.samples():
+            label = _labels(metric.labelnames, values)
+            if isinstance(metric, Histogram):
+                mean = child.sum / child.count if child.count else 0
+                tk.add_row([metric.name + label, metric.TYPE, _number(mean),
+                            child.count, _number(child.sum)])
+            else:
+                tk.add_row([metric.name + label, metric.TYPE,
+                            _number(child.value), "", ""])
+    tk.add_headline("metrics", len(registry.metrics()))
+
+    return tk
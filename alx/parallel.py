@@ -0,0 +1,136 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# Runs a function over many independent items on a pool of processes or
+# threads.  Worker processes send their log records back to the parent
+# so only the parent writes to the application log.
+
+import os
+import time
+import logging
+import logging.handlers
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+
+class TaskResult(NamedTuple):
+    """The outcome of one item passed to `map_parallel`"""
+    index: int
+    """The position of the item in `items`"""
+    item: Any
+    """The item"""
+    result: Any
+    """The value returned by the function, `None` if it raised"""
+    error: BaseException
+    """The exception raised by the function, `None` if it succeeded"""
+    seconds: float
+    """The time taken by the function in the worker"""
+    pid: int
+    """The process that ran the function"""
+
+
+class _ForwardHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        # Written by the parent's logger of the same name
+        logging.getLogger(record.name).handle(record)
+
+
+def _init_worker(log_queue, name: str, level: int) -> None:
+    # Runs once in each worker process.  Handlers inherited from the parent
+    # would write to the same files, so records go back on the queue instead
+    from alx.app import ALXapp
+
+    ALXapp._log_handlers = []
+    ALXapp._log_signature = None
+    ALXapp.log_listener = None
+    for logger in {ALXapp.logger, logging.getLogger(name)}:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(level)
+        logger.propagate = False
+
+
+def _timed_call(func: Callable, item: Any) -> tuple:
+    start = time.perf_counter()
+    try:
+        result, error = func(item), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, time.perf_counter() - start, os.getpid()
+
+
+def map_parallel(func: Callable, items: Iterable, workers: int = None,
+                 mode: str = "process",
+                 logger: logging.Logger = None) -> Iterator[TaskResult]:
+    """
+    Call `func(item)` for every item on a pool of workers and yield a
+    `TaskResult` for each as soon as it finishes, so results arrive in
+    completion order rather than the order of `items`.  An exception
+    raised by `func` is returned in `TaskResult.error` and does not stop
+    the other items.
+
+    At most twice `workers` items are queued at once so `items` can be a
+    long generator.
+
+    In `process` mode `func`, the items and results must be picklable.
+    Log records written to `logger` in the workers are sent back to the
+    parent and written by its handlers.  Workers started with `fork`
+    inherit the configuration, and keys already read by the parent; with
+    `spawn` they read the key file again the first time a secret is used.
+
+    :param func: The function to call with each item
+    :param items: The items
+    :param workers: The number of processes or threads. Default is the
+     number of CPUs
+    :param mode: `process` or `thread`
+    :param logger: The logger that workers log to. Default is `ALXapp.logger`
+    :return: A generator of `TaskResult`
+    """
+    if mode == "process":
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        if logger is None:
+            from alx.app import ALXapp
+            logger = ALXapp.logger
+        log_queue = multiprocessing.Queue()
+        listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_worker,
+                                       initargs=(log_queue, logger.name,
+                                                 logger.getEffectiveLevel()))
+    elif mode == "thread":
+        from concurrent.futures import ThreadPoolExecutor
+
+        listener = None
+        executor = ThreadPoolExecutor(max_workers=workers,
+                                      thread_name_prefix="alx-map")
+    else:
+        raise ValueError("mode must be 'process' or 'thread', not '%s'" % mode)
+
+    limit = 2 * (workers or os.cpu_count() or 1)
+    pending = {}
+    iterator = enumerate(items)
+
+    if listener:
+        listener.start()
+    try:
+        while True:
+            for index, item in iterator:
+                pending[executor.submit(_timed_call, func, item)] = (index, item)
+                if len(pending) >= limit:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = pending.pop(future)
+                yield TaskResult(index, item, *future.result())
+    finally:
+        # If the caller stops early, items not yet started are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+        if listener:
+            listener.stop()
+            log_queue.close()
@@ -7,7 +7,6 @@
 
 import re
 from datetime import datetime, timezone
-from unidecode import unidecode
 
 
 def date_subst(fmt: str, when: datetime = None,
@@ -46,6 +45,7 @@ def replace_accents(s: str) -> str:
     :param s: Input string
     :return: ASCII-only version of string
     """
+    from unidecode import unidecode
     return unidecode(s)
 
 
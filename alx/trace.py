@@ -0,0 +1,255 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# Lightweight tracing of where the time goes in a single run.  Spans are
+# recorded with their thread and nesting and written in batches to a
+# Chrome trace file that can be opened in chrome://tracing or Perfetto.
+# When tracing is off a span is a shared object that does nothing.
+
+import os
+import sys
+import time
+import threading
+import functools
+import contextvars
+from typing import Callable
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_tracer', 'name', 'args', '_start')
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.args = args
+        self._start = 0
+
+    def __enter__(self) -> "_Span":
+        stack = self._tracer._stack.get()
+        if stack:
+            self.args['parent'] = stack[-1].name
+        self._tracer._stack.set(stack + (self,))
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter_ns()
+        tracer = self._tracer
+        stack = tracer._stack.get()
+        # Remove this span even if one entered after it is still open
+        stack = tuple(s for s in stack if s is not self)
+        tracer._stack.set(stack)
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.args['depth'] = len(stack)
+        tracer._record(self.name, self._start, end, self.args)
+        return None
+
+
+class Tracer:
+    ENVIRONMENT = "ALX_TRACE"
+    """Set to `1` to trace an `ALXapp` run"""
+    OPTION = "--trace"
+    """The command line option to trace an `ALXapp` run"""
+
+    def __init__(self, batch_size: int = 1000) -> None:
+        """
+        Records spans, the time taken by a named block of code, and writes
+        them in the [Chrome trace event format](https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU)
+        as complete (`"ph": "X"`) events.  Each event has the thread id
+        and, in `args`, the enclosing span as `parent` and the nesting
+        `depth`.  Spans nest within a thread or an asyncio task, so
+        concurrent tasks on one thread each have their own parents.
+
+        Events are kept in memory and appended to the file every
+        `batch_size` spans and when tracing stops.  The file is valid JSON
+        once `stop` has been called, which is done at exit.  A file cut
+        short by a crash can still be loaded as the closing `]` is optional.
+
+        Tracing is off until `start` is called.  `ALXapp` calls it when
+        `--trace` is passed or `ALX_TRACE` is set.
+
+        :param batch_size: The number of spans to keep before writing
+        """
+        self.enabled = False
+        """Whether spans are being recorded"""
+        self.filename = None
+        """The trace file being written"""
+        self.batch_size = batch_size
+        """The number of spans kept in memory before writing"""
+        self._events = []
+        self._threads = set()
+        self._lock = threading.Lock()
+        # The open spans of each thread or asyncio task
+        self._stack = contextvars.ContextVar("alx_trace_stack_%x" % id(self),
+                                             default=())
+        self._file = None
+        self._base = 0
+
+    @classmethod
+    def requested(cls, argv: list = None) -> bool:
+        """
+        :param argv: The arguments to look for `--trace` in. Default is
+         `sys.argv[1:]`
+        :return: True if tracing was requested on the command line or in
+         the environment
+        """
+        mode = os.environ.get(cls.ENVIRONMENT, '').strip().lower()
+        if mode not in ('', '0', 'false', 'no', 'off'):
+            return True
+        return cls.OPTION in (sys.argv[1:] if argv is None else argv)
+
+    def start(self, filename: str) -> None:
+        """
+        Start recording spans to `filename`, replacing any existing file
+
+        :param filename: The trace file, usually `<log>/<app>.trace.json`
+        """
+        import atexit
+
+        self.stop()
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with self._lock:
+            self.filename = filename
+            self._file = open(filename, "w")
+            self._file.write("[\n")
+            self._threads = set()
+            # Timestamps are microseconds from the start of the trace
+            self._base = time.perf_counter_ns()
+            self.enabled = True
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Write any remaining spans, close the file and stop recording
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self.enabled = False
+            self._write()
+            self._file.write('{"name": "process_name", "ph": "M", "pid": %d, '
+                             '"tid": 0, "args": {"name": "%s"}}\n]\n'
+                             % (os.getpid(), os.path.basename(sys.argv[0])))
+            self._file.close()
+            self._file = None
+
+    def flush(self) -> None:
+        """
+        Write the spans recorded so far to the file
+        """
+        with self._lock:
+            if self._file is not None:
+                self._write()
+                self._file.flush()
+
+    def span(self, name: str, **args):
+        """
+        Time a block of code
+        ```
+        with tracer.span("load", rows=len(rows)):
+            load(rows)
+        ```
+        :param name: The name of the span
+        :param args: Extra values shown with the span
+        :return: A context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def traced(self, name: str = None) -> Callable:
+        """
+        A decorator that runs the function in a span
+        ```
+        @tracer.traced()
+        def load(rows):
+            ...
+        ```
+        :param name: The name of the span.  Default is the qualified name
+         of the function
+        :return: The decorator
+        """
+        def decorator(func: Callable) -> Callable:
+            label = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, label, {}):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _record(self, name: str, start: int, end: int, args: dict) -> None:
+        tid = threading.get_ident()
+        event = {"name": name, "cat": "alx", "ph": "X",
+                 "ts": (start - self._base) / 1000,
+                 "dur": (end - start) / 1000,
+                 "pid": os.getpid(), "tid": tid, "args": args}
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._events.append({"name": "thread_name", "ph": "M",
+                                     "pid": event["pid"], "tid": tid,
+                                     "args": {"name": threading.current_thread().name}})
+            self._events.append(event)
+            if len(self._events) >= self.batch_size and self._file is not None:
+                self._write()
+
+    def _write(self) -> None:
+        # Called with the lock held
+        import json
+
+        events, self._events = self._events, []
+        if events and self._file is not None:
+            self._file.write("".join(json.dumps(e, default=str) + ",\n"
+                                     for e in events))
+
+
+TRACER = Tracer()
+"""The tracer used by alx and `ALXapp.span`"""
+
+
+def _after_fork() -> None:
+    # A forked child must not write into the parent's trace file
+    TRACER.enabled = False
+    TRACER._file = None
+    TRACER._events = []
+    TRACER._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def span(name: str, **args):
+    """
+    `Tracer.span` on the default `TRACER`
+    """
+    return TRACER.span(name, **args)
+
+
+def traced(name: str = None) -> Callable:
+    """
+    `Tracer.traced` on the default `TRACER`
+    """
+    return TRACER.traced(name)
@@ -0,0 +1,159 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# Description:
+# Provides ConfigWatcher which polls the configuration files of a long
+# running ALXapp and applies changes without restarting the process.
+
+import os
+import threading
+from typing import Callable
+from alx.app import ALXapp, LibConfig
+
+
+class ConfigWatcher:
+    def __init__(self, app: ALXapp, interval: float = 5.0) -> None:
+        """
+        Watches `Paths.config`, `alx.ini` and `~/.config/alx/alx.ini` of
+        `app` by polling their modification time and size.  No external
+        modules are needed.
+
+        When a file changes, the configuration is read and parsed on the
+        watcher thread and the new values are then swapped into `app`
+        with a single `dict.update`, so threads using the app never wait
+        for the files to be read.  If `loglevel` changes,
+        `ALXapp.set_log_level` is called.  Callbacks registered with
+        `add_callback` are called with the app and a dict of the changed
+        values.
+        ```
+        watcher = app.watch_config(interval=10)
+        watcher.add_callback(lambda app, changed: cache.resize(app.size))
+        ```
+        Values removed from the file are left unchanged in the app.
+
+        :param app: The application to update
+        :param interval: The number of seconds between checks
+        """
+        self.app = app
+        """The application being updated"""
+        self.interval = interval
+        """The number of seconds between checks"""
+        self.callbacks = []
+        """Functions called as `callback(app, changed)` after a reload"""
+        self._files = (app.paths.config, app.paths.global_config,
+                       app.paths.local_config)
+        self._signatures = self._stat()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self) -> list:
+        result = []
+        for filename in self._files:
+            try:
+                st = os.stat(filename)
+                result.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                result.append(None)
+        return result
+
+    def add_callback(self, callback: Callable) -> None:
+        """
+        Register a function to call after the configuration is reloaded
+
+        :param callback: Called as `callback(app, changed)` where `changed`
+         is a dict of the new values that differ from the old ones
+        """
+        self.callbacks.append(callback)
+
+    def start(self) -> "ConfigWatcher":
+        """
+        Start polling on a daemon thread
+
+        :return: The watcher
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name="alx-config-watcher",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop polling and wait for the thread to finish
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep the current configuration and try again next time
+                self.app.logger.error("Configuration reload failed: %s", e)
+
+    def check(self) -> dict:
+        """
+        Check the files once and reload the configuration if any changed
+
+        :return: A dict of the values that changed, empty if none did
+        """
+        signatures = self._stat()
+        if signatures == self._signatures:
+            return {}
+        lib_changed = signatures[1:] != self._signatures[1:]
+        self._signatures = signatures
+
+        app = self.app
+        config = ALXapp.read_config(app.paths.config)
+        # Parse into a scratch app so `enc:` values stay lazy
+        scratch = ALXapp.__new__(ALXapp)
+        scratch.paths = app.paths
+        if config and app.environment in config:
+            ALXapp.parse_config(scratch, config[app.environment])
+        values = {k: v for k, v in vars(scratch).items() if k != 'paths'}
+        secrets = values.pop('_secrets', {})
+
+        libconfig = LibConfig.reload(app.paths) if lib_changed else app.libconfig
+
+        old_level = self._loglevel(app, app.libconfig)
+        changed = {k: v for k, v in values.items()
+                   if app.__dict__.get(k, None) != v}
+
+        # The swap: one reference and one `dict.update` each
+        app.config = config
+        app.libconfig = libconfig
+        app.__dict__.update(values)
+        current = app.__dict__.setdefault('_secrets', {}) if secrets else {}
+        for name, secret in secrets.items():
+            if name in current and current[name].token == secret.token:
+                # Unchanged, keep the decrypted value
+                continue
+            current[name] = secret
+            # Decrypted again on next access
+            app.__dict__.pop(name, None)
+            changed[name] = secret
+
+        new_level = self._loglevel(app, libconfig)
+        if new_level != old_level:
+            app.set_log_level(new_level)
+
+        app.logger.info("Configuration reloaded, %d values changed", len(changed))
+        for callback in self.callbacks:
+            try:
+                callback(app, changed)
+            except Exception as e:
+                app.logger.error("Configuration callback %r failed: %s",
+                                 callback, e)
+
+        return changed
+
+    @staticmethod
+    def _loglevel(app: ALXapp, libconfig) -> str:
+        if 'loglevel' in app.__dict__:
+            return app.__dict__['loglevel']
+        return libconfig.get('logging', 'loglevel')
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# A resident version of itrs_email.  Start it once and configure the
+# Geneos action to run the thin client instead of itrs_email:
+#
+#   python -m alx.itrs.client itrs_emaild user@example.com
+#
+# The client forwards the recipients and the Geneos environment and exits
+# as soon as the daemon has queued the alert.  The daemon keeps the
+# configuration and smtp connections between alerts.
+#
+# Author: Andrew Lister
+
+from alx.app import ALXapp
+from alx.itrs.daemon import ActionServer, EmailAction
+
+args = [
+    ['--workers', {'type': int, 'default': 4,
+                   'help': 'number of alerts handled at the same time'}]
+]
+
+app = ALXapp("Resident daemon sending ITRS Geneos alert emails", args=args)
+
+server = ActionServer(app, EmailAction(app), workers=app.arguments.workers)
+server.serve_forever()
@@ -4,9 +4,12 @@
 # pytest routines for alx.app
 
 import os
+import platform
+import subprocess
+import sys
 import pytest
 from unittest import mock
-from alx.app import ALXapp, Paths
+from alx.app import ALXapp, ConfigSchema, LibConfig, Paths
 from cryptography.fernet import Fernet, InvalidToken
 
 
@@ -29,6 +32,27 @@ def test_environment_flags(monkeypatch, env_flag, expected):
     assert app.environment == expected
 
 
+IMPORT_BUDGET = 0.25
+"""Maximum seconds allowed for `import alx.app` in a fresh interpreter"""
+
+
+def test_import_time_within_budget():
+    code = ("import sys, time\n"
+            "t = time.perf_counter()\n"
+            "import alx.app\n"
+            "print(time.perf_counter() - t)\n"
+            "heavy = ('argparse', 'json', 'logging.handlers', 'cryptography',\n"
+            "         'unidecode', 'sql_formatter')\n"
+            "print(','.join(m for m in heavy if m in sys.modules))\n")
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root,
+                         capture_output=True, text=True, check=True)
+    elapsed, loaded = out.stdout.splitlines()
+
+    assert loaded == ""
+    assert float(elapsed) < IMPORT_BUDGET
+
+
 def test_paths_dirs_created(tmp_path):
     # Override sys.argv to use a path under tmp_path
     dummy_script = tmp_path / "scripts" / "myapp" / "myapp.py"
@@ -148,6 +172,37 @@ section_only = test_value
         assert not hasattr(result, 'loglevel')
 
 
+def test_parse_all_sections(tmp_path):
+    cfg = tmp_path / "hosts.ini"
+    lines = ["[DEFAULT]", "port = 22", "user = admin", ""]
+    for i in range(200):
+        lines += ["[host%03d]" % i, "address = 10.0.0.%d" % i]
+        if i % 2:
+            lines.append("port = 2222")
+        lines.append("")
+    cfg.write_text("\n".join(lines))
+
+    with mock.patch("sys.argv", ["test_app.py"]):
+        app = ALXapp("Test App")
+        app.config = ALXapp.read_config(str(cfg))
+
+        hosts = app.parse_all_sections()
+        assert len(hosts) == 200
+        assert hosts["host001"].port == 2222
+        assert hosts["host001"].address == "10.0.0.1"
+        assert not hasattr(hosts["host002"], "port")
+
+        full = app.parse_all_sections(include_defaults=True,
+                                      sections=["host002"])
+        assert list(full) == ["host002"]
+        assert full["host002"].port == 22
+        assert full["host002"].user == "admin"
+
+        typed = app.parse_all_sections({"address": str, "port": (int, 22)})
+        assert typed["host002"].port == 22
+        assert typed["host003"].port == 2222
+
+
 # Fix test_parse_config_section_type_conversion - add import check
 def test_parse_config_section_type_conversion(tmp_path):
     """Test that values are converted to correct types"""
@@ -230,4 +285,373 @@ path_value = $data/output.txt
         assert '$data' not in result.path_value
         assert result.path_value.endswith('output.txt')
         # Check that it contains the data directory path
-        assert str(app.paths.data) in result.path_value
\ No newline at end of file
+        assert str(app.paths.data) in result.path_value
+
+
+@pytest.fixture
+def snapshot_app(tmp_path, monkeypatch):
+    """An app installed under tmp_path with its own module config directory"""
+    script = tmp_path / "scripts" / "snap" / "snap.py"
+    script.parent.mkdir(parents=True)
+    script.write_text("")
+    (tmp_path / "etc").mkdir()
+    ini = tmp_path / "etc" / "snap.ini"
+    ini.write_text("[DEFAULT]\ncount = 5\nratio = 0.5\nout = $data/x.txt\n\n[dev]\n")
+    monkeypatch.setattr(Paths, "get_module_config_dir",
+                        staticmethod(lambda: str(tmp_path / "config")))
+    monkeypatch.setattr("sys.argv", [str(script)])
+    return ini
+
+
+def test_config_snapshot_reused(snapshot_app):
+    cold = ALXapp("Snapshot", cache_config=True)
+    assert os.listdir(cold.paths.cache)
+
+    with mock.patch.object(ALXapp, "read_config") as read_config, \
+            mock.patch.object(ALXapp, "parse_config") as parse_config:
+        warm = ALXapp("Snapshot", cache_config=True)
+    read_config.assert_not_called()
+    parse_config.assert_not_called()
+
+    assert warm.count == 5
+    assert warm.ratio == 0.5
+    assert warm.out == os.path.join(cold.paths.data, "x.txt")
+    assert warm.key is None
+    assert warm.libconfig.get('logging', 'when') == 'midnight'
+    assert warm.config.get('dev', 'count') == '5'
+
+
+def test_config_snapshot_seeds_lib_config(snapshot_app, monkeypatch):
+    from alx.html import ALXhtml
+
+    # The shared Paths must see the module config directory of snapshot_app
+    monkeypatch.setattr(LibConfig, "_paths", None)
+    ALXapp("Snapshot", cache_config=True)
+    LibConfig.invalidate()
+    with mock.patch.object(ALXapp, "read_config") as read_config:
+        warm = ALXapp("Snapshot", cache_config=True)
+        html = ALXhtml()
+    read_config.assert_not_called()
+    assert html.config is warm.libconfig
+
+
+def test_config_snapshot_invalidated_by_change(snapshot_app):
+    ALXapp("Snapshot", cache_config=True)
+    snapshot_app.write_text("[DEFAULT]\ncount = 50\n\n[dev]\n")
+
+    app = ALXapp("Snapshot", cache_config=True)
+    assert app.count == 50
+
+
+def test_config_snapshot_ignores_corrupt_file(snapshot_app):
+    app = ALXapp("Snapshot", cache_config=True)
+    for f in os.listdir(app.paths.cache):
+        with open(os.path.join(app.paths.cache, f), "wb") as fp:
+            fp.write(b"not a pickle")
+
+    app = ALXapp("Snapshot", cache_config=True)
+    assert app.count == 5
+
+
+def test_lib_config_shared_between_objects():
+    from alx.html import ALXhtml
+
+    LibConfig.invalidate()
+    with mock.patch.object(ALXapp, "read_config",
+                           wraps=ALXapp.read_config) as read_config:
+        first = ALXhtml()
+        second = ALXhtml()
+    assert first.config is second.config
+    assert read_config.call_count == 1
+
+
+def test_lib_config_reload():
+    from alx.html import ALXhtml
+
+    before = ALXhtml().config
+    after = LibConfig.reload()
+    assert after is not before
+    assert ALXhtml().config is after
+
+
+SCHEMA_INI = """
+[DEFAULT]
+threshold = 10
+ratio = 0.25
+enabled = yes
+hosts = ["a", "b"]
+output = $data/out.txt
+
+[bad]
+threshold = ten
+"""
+
+
+def test_load_section_with_dataclass(tmp_path):
+    from dataclasses import dataclass, field
+    from typing import Optional
+
+    @dataclass(slots=True)
+    class Settings:
+        threshold: int
+        ratio: float
+        enabled: bool
+        hosts: list = field(default_factory=list)
+        output: str = ""
+        missing: Optional[int] = None
+
+    cfg = tmp_path / "schema.ini"
+    cfg.write_text(SCHEMA_INI)
+    with mock.patch("sys.argv", ["test_app.py"]):
+        app = ALXapp("Schema Test")
+    app.config = ALXapp.read_config(str(cfg))
+
+    settings = app.load_section(Settings)
+
+    assert settings.threshold == 10
+    assert settings.ratio == 0.25
+    assert settings.enabled is True
+    assert settings.hosts == ["a", "b"]
+    assert settings.output == app.paths.data + "/out.txt"
+    assert settings.missing is None
+    assert not hasattr(settings, "__dict__")
+    assert ConfigSchema.compile(Settings) is ConfigSchema.compile(Settings)
+
+
+def test_load_section_with_mapping(tmp_path):
+    cfg = tmp_path / "schema.ini"
+    cfg.write_text(SCHEMA_INI)
+    config = ALXapp.read_config(str(cfg))
+
+    schema = ConfigSchema({"ratio": float, "retries": (int, 3), "threshold": int})
+    settings = schema.load(config["DEFAULT"])
+
+    assert (settings.threshold, settings.ratio, settings.retries) == (10, 0.25, 3)
+    assert not hasattr(settings, "__dict__")
+
+    mapping = {"threshold": int, "names": (list, []), "extra": (dict, {})}
+    schema = ConfigSchema.compile(mapping)
+    first = schema.load(config["DEFAULT"])
+    first.names.append("a")
+    assert schema.load(config["DEFAULT"]).names == []
+    assert ConfigSchema.compile(dict(mapping)) is schema
+
+
+def test_load_section_reports_type_errors(tmp_path):
+    cfg = tmp_path / "schema.ini"
+    cfg.write_text(SCHEMA_INI)
+    config = ALXapp.read_config(str(cfg))
+
+    with pytest.raises(ValueError, match=r"\[bad\] threshold"):
+        ConfigSchema({"threshold": int}).load(config["bad"])
+    with pytest.raises(ValueError, match="missing required value"):
+        ConfigSchema({"nothing": int}).load(config["bad"])
+    with pytest.raises(ValueError, match="expected dict"):
+        ConfigSchema({"hosts": dict}).load(config["bad"])
+
+
+def test_queue_logging_mode(tmp_path):
+    from alx.log_util import BoundedQueueHandler
+
+    with mock.patch("sys.argv", ["test_app.py"]):
+        app = ALXapp("Queue Logger")
+    # A private copy so the shared library configuration is not changed
+    app.libconfig = ALXapp.read_config(app.paths.global_config,
+                                       app.paths.local_config)
+    app.libconfig.set('logging', 'mode', 'queue')
+    app.paths.log = str(tmp_path)
+    app.paths.logfile = str(tmp_path / "queue.log")
+
+    try:
+        app.start_logging()
+        assert len(app.logger.handlers) == 1
+        assert isinstance(app.logger.handlers[0], BoundedQueueHandler)
+
+        app.logger.warning("Queued entry")
+        ALXapp.log_listener.stop()
+        assert "Queued entry" in (tmp_path / "queue.log").read_text()
+    finally:
+        ALXapp.stop_logging()
+
+
+def test_queue_logging_stopped_at_exit(tmp_path):
+    from alx.log_util import BoundedQueueHandler
+
+    with mock.patch("sys.argv", ["test_app.py"]):
+        app = ALXapp("Queue Exit")
+    app.libconfig = ALXapp.read_config(app.paths.global_config,
+                                       app.paths.local_config)
+    app.libconfig.set('logging', 'mode', 'queue')
+    app.libconfig.set('logging', 'queue_policy', 'block')
+    app.libconfig.set('logging', 'queue_size', '1')
+    app.paths.log = str(tmp_path)
+    app.paths.logfile = str(tmp_path / "exit.log")
+
+    try:
+        app.start_logging()
+        ALXapp._stop_log_listener()
+        assert ALXapp.log_listener is None
+        assert not any(isinstance(h, BoundedQueueHandler)
+                       for h in app.logger.handlers)
+
+        # Would block forever on the full queue if it were still attached
+        for i in range(3):
+            app.logger.warning("After exit %d", i)
+        assert "After exit 2" in (tmp_path / "exit.log").read_text()
+    finally:
+        ALXapp.stop_logging()
+
+
+def test_bounded_queue_handler_drops_when_full():
+    import logging
+    import queue
+    from alx.log_util import BoundedQueueHandler
+
+    handler = BoundedQueueHandler(queue.Queue(1))
+    record = logging.LogRecord("t", logging.INFO, __file__, 1, "msg", None, None)
+    handler.handle(record)
+    handler.handle(record)
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_repeated_apps_reuse_handlers():
+    with mock.patch("sys.argv", ["test_app.py"]):
+        ALXapp("First")
+        handlers = list(ALXapp.logger.handlers)
+        ALXapp("Second")
+        ALXapp("Third")
+
+    assert ALXapp.logger.handlers == handlers
+
+
+def test_stop_logging_removes_only_alx_handlers():
+    import logging
+
+    with mock.patch("sys.argv", ["test_app.py"]):
+        ALXapp("Teardown")
+    other = logging.NullHandler()
+    ALXapp.logger.addHandler(other)
+
+    ALXapp.stop_logging()
+    assert ALXapp.logger.handlers == [other]
+    ALXapp.logger.removeHandler(other)
+
+    with mock.patch("sys.argv", ["test_app.py"]):
+        ALXapp("Restart")
+    assert ALXapp.logger.handlers
+
+
+@pytest.fixture
+def key_app(tmp_path):
+    with mock.patch("sys.argv", ["test_app.py"]):
+        app = ALXapp("Key Test")
+    app.paths.keyfile = str(tmp_path / "key")
+    return app
+
+
+def write_keys(filename, *keys):
+    with open(filename, "w") as f:
+        for k in keys:
+            f.write(k.decode() + "\n")
+    os.chmod(filename, 0o600)
+
+
+def test_encrypt_decrypt_many(key_app):
+    write_keys(key_app.paths.keyfile, Fernet.generate_key())
+
+    plain = ["one", "two", "three"]
+    encrypted = key_app.encrypt_many(plain)
+
+    assert encrypted != plain
+    assert key_app.decrypt_many(encrypted) == plain
+
+
+def test_key_cache_shared_and_invalidated(key_app):
+    old = Fernet.generate_key()
+    write_keys(key_app.paths.keyfile, old)
+    token = key_app.encrypt("secret")
+
+    other = ALXapp.__new__(ALXapp)
+    other.paths = key_app.paths
+    assert other._read_key() is key_app._read_key()
+
+    # A new primary key, the old one is still accepted for decryption
+    new = Fernet.generate_key()
+    write_keys(key_app.paths.keyfile, new, old)
+    st = os.stat(key_app.paths.keyfile)
+    os.utime(key_app.paths.keyfile, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert key_app.decrypt(token) == "secret"
+    rotated = key_app.rotate(token)
+    assert Fernet(new).decrypt(rotated.encode()) == b"secret"
+    with pytest.raises(InvalidToken):
+        Fernet(old).decrypt(rotated.encode())
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="No file modes on Windows")
+def test_key_cache_checks_permissions(key_app):
+    write_keys(key_app.paths.keyfile, Fernet.generate_key())
+    key_app._read_key()
+
+    os.chmod(key_app.paths.keyfile, 0o644)
+    with pytest.raises(SystemExit):
+        key_app._read_key()
+
+
+def test_encrypted_values_decrypted_lazily(key_app, tmp_path):
+    from alx.app import Secret, _read_keyfile
+
+    write_keys(key_app.paths.keyfile, Fernet.generate_key())
+    token = key_app.encrypt("hunter2")
+    cfg = tmp_path / "secret.ini"
+    cfg.write_text("[DEFAULT]\npassword = enc:%s\nuser = bob\n" % token)
+    config = ALXapp.read_config(str(cfg))
+
+    with mock.patch("alx.app._read_keyfile", wraps=_read_keyfile) as read:
+        ALXapp.parse_config(key_app, config["DEFAULT"])
+        assert key_app.user == "bob"
+        assert "password" not in vars(key_app)
+        read.assert_not_called()
+
+        assert key_app.password == "hunter2"
+        assert key_app.password == "hunter2"
+        assert read.call_count == 1
+
+    obj = type("Dummy", (), {})()
+    obj.paths = key_app.paths
+    ALXapp.parse_config(obj, config["DEFAULT"])
+    assert isinstance(obj.password, Secret)
+    assert "hunter2" not in repr(obj.password)
+    assert str(obj.password) == "hunter2"
+
+
+def test_startup_profile_from_option(snapshot_app, monkeypatch):
+    import json
+
+    monkeypatch.setattr("sys.argv", sys.argv + ["--profile-startup"])
+    app = ALXapp("Profile")
+
+    with open(os.path.join(app.paths.log, "snap.startup.json")) as f:
+        result = json.load(f)
+    phases = [p["phase"] for p in result["phases"]]
+    assert phases == ["argparse", "paths", "read_config", "parse_config",
+                      "read_lib_config", "start_logging"]
+    assert result["total"] >= sum(p["seconds"] for p in result["phases"])
+    assert "cprofile" not in result
+
+
+def test_startup_profile_cprofile(snapshot_app, monkeypatch):
+    import pstats
+
+    monkeypatch.setenv("ALX_PROFILE_STARTUP", "cprofile")
+    app = ALXapp("Profile")
+
+    stats = pstats.Stats(os.path.join(app.paths.log, "snap.startup.prof"))
+    assert stats.total_calls > 0
+
+
+def test_startup_profile_disabled(snapshot_app):
+    app = ALXapp("Profile")
+    assert not os.path.exists(os.path.join(app.paths.log, "snap.startup.json"))
@@ -0,0 +1,63 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.async_db
+
+import asyncio
+import pytest
+from alx.async_db import AsyncALXdatabase, _numbered_placeholders
+
+
+def test_sqlite_through_executor(tmp_path):
+    async def main():
+        async with AsyncALXdatabase(dbtype="sqlite",
+                                    database=str(tmp_path / "a.db")) as db:
+            assert db.backend == "executor"
+            await db.run("CREATE TABLE t (id INTEGER)")
+            await db.run("INSERT INTO t VALUES (%s)",
+                         params=[(i,) for i in range(100)], multi=True)
+
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            task = asyncio.create_task(ticker())
+            results = await asyncio.gather(
+                *[db.run("SELECT id FROM t WHERE id = %s", params=(i,))
+                  for i in range(100)])
+            task.cancel()
+            assert results == [[(i,)] for i in range(100)]
+            # The loop kept running while the queries were executed
+            assert ticks > 0
+
+        async with AsyncALXdatabase(dbtype="sqlite",
+                                    database=str(tmp_path / "a.db")) as db:
+            # Committed on leaving the first block
+            assert await db.run("SELECT count(*) FROM t") == [(100,)]
+            with pytest.raises(Exception):
+                await db.run("SELECT * FROM missing")
+
+    asyncio.run(main())
+
+
+def test_native_falls_back_without_driver(monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+
+    def no_asyncpg(name, *args, **kwargs):
+        if name == "asyncpg":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_asyncpg)
+    db = AsyncALXdatabase(dbtype="postgres")
+    assert db.backend == "executor"
+
+
+def test_numbered_placeholders():
+    assert (_numbered_placeholders("SELECT * FROM t WHERE a = %s AND b = %s")
+            == "SELECT * FROM t WHERE a = $1 AND b = $2")
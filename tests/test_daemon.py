@@ -0,0 +1,88 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.itrs.daemon and alx.itrs.client
+
+import os
+import sys
+import threading
+import tempfile
+import pytest
+from unittest import mock
+from alx.app import ALXapp
+from alx.itrs import client
+from alx.itrs.daemon import ActionServer, EmailAction
+from alx.itrs.environment import Environment
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32",
+                                reason="Unix domain sockets only")
+
+
+@pytest.fixture
+def app():
+    with mock.patch("sys.argv", ["test_daemon.py"]):
+        return ALXapp("Daemon Test")
+
+
+@pytest.fixture
+def socket_file():
+    # Keep the path short, Unix socket paths are limited to ~100 characters
+    directory = tempfile.mkdtemp(prefix="alx")
+    yield os.path.join(directory, "test.sock")
+    os.rmdir(directory)
+
+
+def test_client_forwards_argv_and_geneos_environment(app, socket_file):
+    received = []
+    done = threading.Event()
+
+    def handler(argv, environment):
+        received.append((argv, environment))
+        done.set()
+
+    server = ActionServer(app, handler, path=socket_file)
+    thread = server.start()
+    try:
+        environ = {"_SEVERITY": "WARNING", "_units": "orders",
+                   "location": "Hong Kong", "HOME": "/nowhere"}
+        assert client.send_action(socket_file, ["a@b.com"], environ)
+        assert done.wait(5)
+    finally:
+        server.shutdown()
+        thread.join(5)
+
+    argv, environment = received[0]
+    assert argv == ["a@b.com"]
+    assert isinstance(environment, Environment)
+    assert environment.severity == "warning"
+    assert environment.location == "Hong Kong"
+    assert environment.dataview_columns == {"units": "orders"}
+    assert not os.path.exists(socket_file)
+
+
+def test_client_main_without_daemon(monkeypatch, socket_file, capsys):
+    monkeypatch.setattr(client, "socket_path", lambda name: socket_file)
+    assert client.main(["missing"]) == 1
+    assert socket_file in capsys.readouterr().err
+
+
+def test_socket_in_use(app, socket_file):
+    first = ActionServer(app, lambda argv, env: None, path=socket_file)
+    thread = first.start()
+    try:
+        with pytest.raises(RuntimeError, match="already in use"):
+            ActionServer(app, lambda argv, env: None, path=socket_file)._bind()
+    finally:
+        first.shutdown()
+        thread.join(5)
+
+
+def test_email_action_uses_pool(app):
+    action = EmailAction(app, pool=mock.MagicMock())
+    with mock.patch("alx.itrs.daemon.ALXmail") as mail_class:
+        action(["a@b.com,c@d.com"], Environment({"_SEVERITY": "CRITICAL"}))
+
+    mail = mail_class.return_value
+    mail.set_smtp_pool.assert_called_once_with(action.pool)
+    mail.set_recipients.assert_called_once_with("a@b.com,c@d.com")
+    mail.send.assert_called_once()
@@ -3,9 +3,15 @@
 #
 # pytest routines for alx.db_util
 
+import logging
+import threading
+import time
 import pytest
+from array import array
 from unittest.mock import MagicMock, call
-from alx.db_util import ALXdatabase  # Adjust import as needed
+from alx.db_util import ALXdatabase, ALXdatabasePool, ResultCache, _format_sql, \
+    _prepare, _extend_column
+from alx.metrics import REGISTRY
 
 
 @pytest.fixture
@@ -170,3 +176,426 @@ def test_sqlite_bulk_insert(sqlite_db):
 
     results = sqlite_db.run("SELECT msg FROM log")
     assert [r[0] for r in results] == ["Log 1", "Log 2", "Log 3"]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ALXdatabasePool(dbtype="sqlite", database=str(tmp_path / "pool.db"),
+                           min_size=1, max_size=2, timeout=0.2)
+    with pool.connection() as db:
+        db.run("CREATE TABLE t (id INTEGER)")
+    yield pool
+    pool.close()
+
+
+def test_pool_reuses_connections(pool):
+    with pool.connection() as db:
+        db.run("INSERT INTO t VALUES (?)", params=(1,))
+        first = db
+    with pool.connection() as db:
+        assert db is first
+        assert db.run("SELECT id FROM t") == [(1,)]
+
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert stats['in_use'] == 0
+    assert stats['checkouts'] == 3
+
+
+def test_only_pooled_sqlite_connections_cross_threads(pool, tmp_path):
+    import sqlite3
+
+    def count(db, result):
+        try:
+            result.append(db.run("SELECT count(*) FROM t"))
+        except sqlite3.ProgrammingError as e:
+            result.append(e)
+
+    with pool.connection() as db:
+        result = []
+        thread = threading.Thread(target=count, args=(db, result))
+        thread.start()
+        thread.join()
+        assert result == [[(0,)]]
+
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "pool.db"),
+                     autoconnect=True)
+    result = []
+    thread = threading.Thread(target=count, args=(db, result))
+    thread.start()
+    thread.join()
+    assert isinstance(result[0], sqlite3.ProgrammingError)
+    db.close()
+
+
+def test_pool_rolls_back_on_error(pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection() as db:
+            db.run("INSERT INTO t VALUES (?)", params=(2,))
+            raise RuntimeError("fail")
+    with pool.connection() as db:
+        assert db.run("SELECT id FROM t") == []
+
+
+def test_pool_checkout_timeout(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    assert pool.stats()['in_use'] == 2
+    assert pool.stats()['timeouts'] == 1
+
+    # A waiting thread gets the connection when it is released
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(a)
+    waiter.join()
+    assert result == [a]
+    assert pool.stats()['waits'] == 2
+    pool.release(b)
+    pool.release(a)
+
+
+def test_pool_replaces_dead_and_old_connections(pool):
+    db = pool.acquire()
+    pool.release(db)
+    db.connection.close()
+    replacement = pool.acquire()
+    assert replacement is not db
+    assert pool.stats()['failed_checks'] == 1
+    pool.release(replacement)
+
+    pool.max_age = 0.01
+    time.sleep(0.02)
+    with pool.connection() as fresh:
+        assert fresh is not replacement
+    assert pool.stats()['closed'] == 2
+
+
+def test_stream_fetches_in_batches(tmp_path):
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "stream.db"),
+                     autoconnect=True)
+    db.run("CREATE TABLE t (id INTEGER)")
+    db.run("INSERT INTO t VALUES (%s)", params=[(i,) for i in range(25)],
+           multi=True)
+    db.commit()
+
+    rows = db.stream("SELECT id FROM t WHERE id >= %s ORDER BY id",
+                     params=(5,), batch_size=10)
+    assert next(rows) == (5,)
+    assert [r[0] for r in rows] == list(range(6, 25))
+    db.close()
+
+
+def test_stream_uses_server_side_cursors():
+    db = ALXdatabase(dbtype="postgres", autoconnect=False)
+    db.connection = MagicMock()
+    cursor = db.connection.cursor.return_value
+    cursor.fetchmany.side_effect = [[(1,), (2,)], []]
+
+    assert list(db.stream("SELECT id FROM t", batch_size=2)) == [(1,), (2,)]
+    assert db.connection.cursor.call_args.kwargs["name"].startswith("alx_stream_")
+    assert cursor.itersize == 2
+    cursor.fetchmany.assert_called_with(2)
+    cursor.close.assert_called_once()
+
+
+def test_sql_is_only_formatted_when_logged(mock_db_util, monkeypatch):
+    calls = []
+    monkeypatch.setattr("alx.db_util._format_sql",
+                        lambda sql: calls.append(sql) or sql)
+    mock_db_util.logger = logging.getLogger("alx_db_util_test")
+    mock_db_util.logger.setLevel(logging.DEBUG)
+    monkeypatch.setattr(mock_db_util.logger, "propagate", False)
+    mock_db_util.cursor.description = None
+    mock_db_util.cursor.rowcount = 1
+
+    # The logger is at DEBUG but nothing writes the record
+    mock_db_util.run("UPDATE t SET a = 1", name="update")
+    assert calls == []
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = lambda record: records.append(record.getMessage())
+    mock_db_util.logger.addHandler(handler)
+    try:
+        mock_db_util.run("UPDATE t SET a = %s", name="update", params=(1,))
+    finally:
+        mock_db_util.logger.removeHandler(handler)
+    assert calls == ["UPDATE t SET a = ?"]
+    assert "update:\nUPDATE t SET a = ?\nParams: (1,)" in records
+
+
+def test_formatted_statements_are_cached():
+    _format_sql.cache_clear()
+    for _ in range(3):
+        _format_sql("SELECT a FROM t")
+    info = _format_sql.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+
+
+def test_bulk_insert_sqlite(tmp_path):
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "bulk.db"),
+                     autoconnect=True)
+    db.run("CREATE TABLE t (id INTEGER, name TEXT)")
+
+    rows = ((i, "row%d" % i) for i in range(2500))
+    stats = db.bulk_insert("t", ["id", "name"], rows, chunk_size=1000)
+
+    assert stats['rows'] == 2500
+    assert stats['chunks'] == 3
+    assert REGISTRY.counter("alx_db_rows_total").labels("bulk:t").value >= 2500
+    assert db.run("SELECT count(*), max(name) FROM t") == [(2500, "row999")]
+    db.close()
+
+
+def test_bulk_insert_rolls_back_on_error(tmp_path):
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "bulk.db"),
+                     autoconnect=True)
+    db.run("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    db.commit()
+
+    with pytest.raises(Exception):
+        db.bulk_insert("t", ["id"], [(1,), (2,), (1,)], chunk_size=2)
+    assert db.run("SELECT count(*) FROM t") == [(0,)]
+
+    with pytest.raises(ValueError):
+        db.bulk_insert("t; DROP TABLE t", ["id"], [])
+    db.close()
+
+
+def test_bulk_insert_mysql_uses_multi_row_values(mock_db_util):
+    mock_db_util.dbtype = "mysql"
+    mock_db_util.bulk_insert("t", ["a", "b"], [(1, 2), (3, 4), (5, 6)],
+                             chunk_size=2, commit='chunk')
+
+    assert mock_db_util.cursor.execute.call_args_list == [
+        call("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)", [1, 2, 3, 4]),
+        call("INSERT INTO t (a, b) VALUES (%s, %s)", [5, 6]),
+    ]
+    assert mock_db_util.connection.commit.call_count == 2
+
+
+def test_bulk_insert_postgres_uses_copy(mock_db_util):
+    mock_db_util.dbtype = "postgres"
+    mock_db_util.bulk_insert("t", ["a", "b"], [(1, None), (2, "x\ty")])
+
+    sql, data = mock_db_util.cursor.copy_expert.call_args.args
+    assert sql == "COPY t (a, b) FROM STDIN"
+    assert data.getvalue() == "1\t\\N\n2\tx\\ty\n"
+    mock_db_util.connection.commit.assert_called_once()
+
+
+def test_bulk_insert_postgres_copies_bytes_and_json(mock_db_util):
+    mock_db_util.dbtype = "postgres"
+    mock_db_util.bulk_insert("t", ["a", "b"], [(b"\x00\x01", {"a": [1, "x\ty"]})])
+
+    sql, data = mock_db_util.cursor.copy_expert.call_args.args
+    assert data.getvalue() == '\\\\x0001\t{"a": [1, "x\\\\ty"]}\n'
+
+    with pytest.raises(ValueError):
+        mock_db_util.bulk_insert("t", ["a"], [({1, 2},)])
+
+
+def test_statement_cache(mock_db_util):
+    mock_db_util.cursor.description = None
+    mock_db_util.cursor.rowcount = 1
+    sql = "  UPDATE t SET a = %s WHERE b = %s  "
+    before = ALXdatabase.statement_cache_info()
+
+    for i in range(5):
+        mock_db_util.run(sql, params=(i, i))
+
+    after = ALXdatabase.statement_cache_info()
+    assert after.misses - before.misses == 1
+    assert after.hits - before.hits == 4
+    mock_db_util.cursor.execute.assert_called_with(
+        "UPDATE t SET a = ? WHERE b = ?", (4, 4))
+
+
+def test_statement_kind():
+    assert _prepare("select 1", "mysql").kind == "select"
+    assert _prepare("WITH x AS (SELECT 1) SELECT * FROM x", "mysql").kind == "select"
+    assert _prepare("insert into t values (%s)", "postgres").kind == "dml"
+    assert _prepare("create table t (a int)", "sqlite").kind == "other"
+    assert _prepare("select\n  a,\n  b\nfrom t", "sqlite").header == "select a, b from t"
+
+
+@pytest.fixture
+def cached_db(tmp_path):
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "cache.db"),
+                     autoconnect=True)
+    db.run("CREATE TABLE hosts (name TEXT)")
+    db.run("INSERT INTO hosts VALUES ('a')")
+    db.set_result_cache(ResultCache())
+    yield db
+    db.close()
+
+
+def test_result_cache_hits_and_dml_invalidation(cached_db):
+    sql = "SELECT name FROM hosts"
+    assert cached_db.run(sql, cache_ttl=60) == [("a",)]
+    # Whitespace differences share the entry
+    assert cached_db.run("SELECT  name\nFROM hosts", cache_ttl=60) == [("a",)]
+    assert cached_db.result_cache.stats()['hits'] == 1
+
+    cached_db.cursor.execute("INSERT INTO hosts VALUES ('b')")
+    assert cached_db.run(sql, cache_ttl=60) == [("a",)]
+
+    cached_db.run("INSERT INTO hosts VALUES ('c')")
+    assert len(cached_db.run(sql, cache_ttl=60)) == 3
+    # Without a TTL the statement is never cached
+    assert cached_db.run(sql) == cached_db.run(sql, cache_ttl=60)
+
+
+def test_result_cache_invalidated_by_other_writes(cached_db):
+    sql = "SELECT count(*) FROM hosts"
+    assert cached_db.run(sql, cache_ttl=60) == [(1,)]
+    cached_db.run("WITH n AS (SELECT 'b' AS name) "
+                  "INSERT INTO hosts SELECT name FROM n")
+    assert cached_db.run(sql, cache_ttl=60) == [(2,)]
+
+    cached_db.run("ALTER TABLE hosts ADD COLUMN site TEXT")
+    assert cached_db.result_cache.stats()['entries'] == 0
+
+    assert _prepare("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+                    "postgres").kind == "dml"
+    assert _prepare("TRUNCATE t", "postgres").kind == "other"
+    assert _prepare("BEGIN", "postgres").kind == "control"
+
+
+def test_result_cache_invalidated_by_bulk_insert(cached_db):
+    sql = "SELECT count(*) FROM hosts"
+    assert cached_db.run(sql, cache_ttl=60) == [(1,)]
+
+    cached_db.bulk_insert("hosts", ["name"], [("b",), ("c",)])
+
+    assert cached_db.run(sql, cache_ttl=60) == [(3,)]
+
+
+def test_result_cache_ttl_tags_and_size():
+    cache = ResultCache(max_bytes=2000)
+    cache.put("k1", [(1,)], ttl=-1)
+    assert cache.get("k1") is None
+
+    cache.put("k2", [(2,)], ttl=60, tags=("Hosts",))
+    assert cache.invalidate("hosts") == 1
+    assert cache.get("k2") is None
+
+    for i in range(20):
+        cache.put(i, [(i, "x" * 50)], ttl=60)
+    stats = cache.stats()
+    assert stats['bytes'] <= 2000
+    assert stats['evictions'] > 0
+    assert cache.get(19) == [(19, "x" * 50)]
+    assert cache.get(0) is None
+
+
+def test_result_cache_persists(tmp_path):
+    filename = str(tmp_path / "results")
+    cache = ResultCache(filename=filename)
+    cache.put("k", [(1, "a")], ttl=60, tags=("t",))
+    cache.put("old", [(2,)], ttl=-1)
+    cache.save()
+
+    loaded = ResultCache(filename=filename)
+    assert loaded.get("k") == [(1, "a")]
+    assert loaded.stats()['entries'] == 1
+    assert loaded.invalidate("t") == 1
+
+
+def test_result_caches_saved_at_exit_are_held_weakly(tmp_path):
+    import gc
+    from alx.db_util import _persistent_caches
+
+    cache = ResultCache(filename=str(tmp_path / "results"))
+    assert cache in _persistent_caches
+    del cache
+    gc.collect()
+    assert not any(c.filename == str(tmp_path / "results")
+                   for c in _persistent_caches)
+
+
+@pytest.fixture
+def samples_db(tmp_path):
+    db = ALXdatabase(dbtype="sqlite", database=str(tmp_path / "cols.db"),
+                     autoconnect=True)
+    db.run("CREATE TABLE samples (host TEXT, cpu REAL, count INTEGER)")
+    db.bulk_insert("samples", ["host", "cpu", "count"],
+                   (("host%d" % (i % 3), i / 2, i) for i in range(25)))
+    yield db
+    db.close()
+
+
+def test_fetch_columns(samples_db):
+    columns = samples_db.fetch_columns(
+        "SELECT host, cpu, count FROM samples ORDER BY count", batch_size=10)
+
+    assert list(columns) == ["host", "cpu", "count"]
+    assert columns["host"][:2] == ["host0", "host1"]
+    assert columns["cpu"].typecode == "d"
+    assert columns["count"].typecode == "q"
+    assert sum(columns["count"]) == sum(range(25))
+    assert columns["cpu"][3] == 1.5
+
+
+def test_columns_widen_when_values_do_not_fit(samples_db):
+    samples_db.run("INSERT INTO samples VALUES ('x', NULL, 2.5)")
+    columns = samples_db.run("SELECT cpu, count FROM samples ORDER BY rowid",
+                             as_columns=True)
+
+    # A NULL turns the float column into a list, a float widens the integers
+    assert type(columns["cpu"]) is list
+    assert columns["cpu"][-1] is None
+    assert columns["count"].typecode == "d"
+    assert columns["count"][-1] == 2.5
+    assert len(columns["count"]) == 26
+
+
+def test_columns_keep_integers_beyond_int64():
+    # BIGINT UNSIGNED values do not fit an int64 or a double exactly
+    column = _extend_column(array('q', [1]), (2**64 + 1, 2))
+
+    assert type(column) is list
+    assert column == [1, 2**64 + 1, 2]
+    assert _extend_column(array('q', [1]), (2, 0.5)).typecode == 'd'
+
+
+def test_fetch_columns_numpy(samples_db):
+    np = pytest.importorskip("numpy")
+    columns = samples_db.fetch_columns("SELECT cpu, count FROM samples",
+                                       numpy=True)
+    assert isinstance(columns["cpu"], np.ndarray)
+    assert columns["count"].sum() == sum(range(25))
+
+
+@pytest.mark.parametrize("factory", ["tuple", "namedtuple", "dict"])
+def test_row_factories(samples_db, factory):
+    samples_db.set_row_factory(factory)
+    sql = "SELECT host, count, count(*) FROM samples WHERE count = %s"
+    row = samples_db.run(sql, params=(4,))[0]
+    streamed = next(samples_db.stream(sql, params=(4,)))
+
+    if factory == "dict":
+        assert row == {"host": "host1", "count": 4, "count(*)": 1}
+    else:
+        assert row == ("host1", 4, 1)
+    if factory == "namedtuple":
+        assert (row.host, row.count, row._2) == ("host1", 4, 1)
+        assert type(row) is type(streamed)
+        assert not hasattr(row, "__dict__")
+    assert streamed == row
+
+
+def test_row_factory_with_result_cache(samples_db):
+    samples_db.set_result_cache(ResultCache())
+    samples_db.set_row_factory("namedtuple")
+    sql = "SELECT host FROM samples WHERE count = 1"
+    first = samples_db.run(sql, cache_ttl=60)
+    cached = samples_db.run(sql, cache_ttl=60)
+    assert cached[0].host == first[0].host == "host1"
+    assert samples_db.result_cache.stats()['hits'] == 1
+
+    with pytest.raises(ValueError):
+        samples_db.set_row_factory("object")
@@ -0,0 +1,69 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.log_util
+
+import gzip
+import logging
+import os
+import time
+import pytest
+from alx.log_util import Compressor, SizedTimedRotatingFileHandler
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_rolls_on_size(tmp_path):
+    logfile = tmp_path / "app.log"
+    handler = SizedTimedRotatingFileHandler(str(logfile), max_bytes=100)
+    try:
+        for i in range(10):
+            handler.handle(make_record("x" * 40))
+    finally:
+        handler.close()
+
+    rolled = [f for f in os.listdir(tmp_path) if f != "app.log"]
+    assert len(rolled) >= 3
+    # Names are unique within a period, nothing was overwritten
+    total = sum(os.path.getsize(tmp_path / f) for f in os.listdir(tmp_path))
+    assert total == 10 * 41
+
+
+def test_rolled_files_are_compressed(tmp_path):
+    logfile = tmp_path / "app.log"
+    handler = SizedTimedRotatingFileHandler(str(logfile), max_bytes=10,
+                                            compress="gzip")
+    try:
+        handler.handle(make_record("first line"))
+        handler.handle(make_record("second line"))
+    finally:
+        handler.close()
+
+    compressed = [f for f in os.listdir(tmp_path) if f.endswith(".gz")]
+    assert len(compressed) == 1
+    with gzip.open(tmp_path / compressed[0], "rt") as f:
+        assert f.read() == "first line\n"
+    assert logfile.read_text() == "second line\n"
+
+
+def test_retention_by_days(tmp_path):
+    logfile = tmp_path / "app.log"
+    old = tmp_path / "app.log.2020-01-01.gz"
+    recent = tmp_path / "app.log.2020-01-02"
+    old.write_text("old")
+    recent.write_text("recent")
+    stale = time.time() - 3 * 86400
+    os.utime(old, (stale, stale))
+
+    handler = SizedTimedRotatingFileHandler(str(logfile), days=2)
+    try:
+        assert handler.getFilesToDelete() == [str(old)]
+    finally:
+        handler.close()
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        Compressor("rar")
@@ -323,4 +323,58 @@ def test_send_passes_unverified_context_when_disabled(monkeypatch):
 
     mail.send()
 
-    assert dummy_holder["instance"].tls_context.verify_mode.name == "CERT_NONE"
\ No newline at end of file
+    assert dummy_holder["instance"].tls_context.verify_mode.name == "CERT_NONE"
+
+
+def test_smtp_pool_reuses_connection(monkeypatch):
+    from alx.mail import SMTPPool
+
+    mock_smtp = MagicMock()
+    mock_smtp.return_value.noop.return_value = (250, b"OK")
+    monkeypatch.setattr("smtplib.SMTP", mock_smtp)
+    pool = SMTPPool()
+
+    for _ in range(3):
+        mail = _mailer(mail_type="plain")
+        mail.set_smtp_pool(pool)
+        mail.add_recipient("a@b.com")
+        mail.send()
+
+    assert mock_smtp.call_count == 1
+    assert mock_smtp.return_value.send_message.call_count == 3
+    mock_smtp.return_value.quit.assert_not_called()
+
+    pool.close()
+    mock_smtp.return_value.quit.assert_called_once()
+
+
+def test_smtp_pool_replaces_dead_connection(monkeypatch):
+    from alx.mail import SMTPPool
+
+    mock_smtp = MagicMock()
+    mock_smtp.return_value.noop.side_effect = OSError("gone")
+    monkeypatch.setattr("smtplib.SMTP", mock_smtp)
+    pool = SMTPPool()
+
+    for _ in range(2):
+        mail = _mailer(mail_type="plain")
+        mail.set_smtp_pool(pool)
+        mail.send()
+
+    assert mock_smtp.call_count == 2
+
+
+def test_connect_steps_are_traced(monkeypatch, tmp_path):
+    import json
+    from alx.trace import Tracer
+
+    tracer = Tracer()
+    monkeypatch.setattr("alx.mail.TRACER", tracer)
+    monkeypatch.setattr("smtplib.SMTP", MagicMock())
+    tracer.start(str(tmp_path / "mail.trace.json"))
+    _mailer(tls=True, user="bob", password="s3cret")._connect()
+    tracer.stop()
+
+    with open(tmp_path / "mail.trace.json") as f:
+        names = [e["name"] for e in json.load(f) if e["ph"] == "X"]
+    assert names == ["smtp.connect", "smtp.starttls", "smtp.login"]
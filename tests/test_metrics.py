@@ -0,0 +1,101 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.metrics
+
+import pytest
+from alx.metrics import Registry, REGISTRY, prometheus_text, \
+    write_prometheus, toolkit
+from alx.db_util import ALXdatabase
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    c = registry.counter("requests_total", "Requests", ("method",))
+    c.labels("get").inc()
+    c.labels("get").inc(2)
+    g = registry.gauge("queue_depth", "Depth")
+    g.set(5)
+    g.dec()
+
+    assert registry.counter("requests_total") is c
+    assert c.labels("get").value == 3
+    assert g.labels().value == 4
+    with pytest.raises(ValueError):
+        c.labels()
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total")
+
+
+def test_histogram_prometheus_format(tmp_path):
+    registry = Registry()
+    h = registry.histogram("latency_seconds", "Latency", ("query",),
+                           buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 5):
+        h.labels('a"b').observe(v)
+
+    text = prometheus_text(registry)
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{query="a\\"b",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{query="a\\"b",le="1"} 3' in text
+    assert 'latency_seconds_bucket{query="a\\"b",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{query="a\\"b"} 6.05' in text
+    assert 'latency_seconds_count{query="a\\"b"} 4' in text
+
+    filename = tmp_path / "alx.prom"
+    write_prometheus(str(filename), registry)
+    assert filename.read_text() == text
+    assert list(tmp_path.iterdir()) == [filename]
+
+
+def test_special_values():
+    registry = Registry()
+    registry.gauge("nan").set(float("nan"))
+    registry.gauge("low").set(float("-inf"))
+    registry.gauge("high").set(float("inf"))
+
+    text = prometheus_text(registry)
+    assert "nan NaN" in text
+    assert "low -Inf" in text
+    assert "high +Inf" in text
+
+
+def test_toolkit_export(tmp_path):
+    registry = Registry()
+    registry.counter("sent_total").inc(3)
+    registry.histogram("send_seconds").observe(2.0)
+    registry.histogram("send_seconds").observe(4.0)
+
+    filename = tmp_path / "metrics.csv"
+    toolkit(str(filename), registry).ok()
+    lines = filename.read_text().splitlines()
+
+    assert lines[0] == "metric,type,value,count,sum"
+    assert "<!>metrics,2" in lines
+    assert "send_seconds,histogram,3,2,6" in lines
+    assert "sent_total,counter,3,," in lines
+
+
+def test_database_queries_are_recorded():
+    db = ALXdatabase(dbtype="sqlite", database=":memory:", autoconnect=True)
+    db.run("create table t (a integer)")
+    db.run("insert into t values (?)", params=[(1,), (2,)], multi=True)
+    before = REGISTRY.histogram("alx_db_query_seconds").labels("count_t").count
+
+    db.run("select a from t", name="count_t")
+
+    assert REGISTRY.histogram("alx_db_query_seconds").labels("count_t").count == before + 1
+    assert REGISTRY.counter("alx_db_rows_total").labels("count_t").value >= 2
+    db.close()
+
+
+def test_html_bytes_are_counted():
+    from alx.html import ALXhtml
+
+    counter = REGISTRY.counter("alx_html_bytes_total")
+    html = ALXhtml("t")
+    html.add_paragraph("café")
+    before = counter.labels().value
+    value = html.get_html()
+
+    assert counter.labels().value - before == len(value.encode())
@@ -0,0 +1,58 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.parallel
+
+import logging
+import os
+import time
+import pytest
+from alx.parallel import map_parallel
+
+
+def square(n: int) -> int:
+    logging.getLogger("alx_parallel_test").info("squaring %d", n)
+    if n == 3:
+        raise ValueError("three")
+    return n * n
+
+
+def sleep_then_return(n: float) -> float:
+    time.sleep(n)
+    return n
+
+
+@pytest.mark.parametrize("mode", ["process", "thread"])
+def test_results_and_errors(mode):
+    results = list(map_parallel(square, range(6), workers=2, mode=mode,
+                                logger=logging.getLogger("alx_parallel_test")))
+
+    assert sorted(r.index for r in results) == list(range(6))
+    by_item = {r.item: r for r in results}
+    assert by_item[4].result == 16
+    assert isinstance(by_item[3].error, ValueError)
+    assert by_item[3].result is None
+    assert all(r.seconds >= 0 for r in results)
+    if mode == "process":
+        assert all(r.pid != os.getpid() for r in results)
+
+
+def test_completion_order():
+    results = map_parallel(sleep_then_return, [0.5, 0.0], workers=2,
+                           mode="thread")
+    assert [r.item for r in results] == [0.0, 0.5]
+
+
+def test_child_logs_are_forwarded(caplog):
+    logger = logging.getLogger("alx_parallel_test")
+    with caplog.at_level(logging.INFO, logger="alx_parallel_test"):
+        list(map_parallel(square, [1, 2], workers=2, logger=logger))
+
+    messages = [r.getMessage() for r in caplog.records
+                if r.name == "alx_parallel_test"]
+    assert sorted(messages) == ["squaring 1", "squaring 2"]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        list(map_parallel(square, [1], mode="fibre"))
@@ -0,0 +1,93 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.trace
+
+import json
+import asyncio
+import threading
+import pytest
+from alx.trace import Tracer, _NULL_SPAN
+
+
+def spans(filename) -> list:
+    with open(filename) as f:
+        return [e for e in json.load(f) if e["ph"] == "X"]
+
+
+def test_disabled_span_does_nothing():
+    tracer = Tracer()
+    assert tracer.span("anything") is _NULL_SPAN
+
+    @tracer.traced()
+    def add(a, b):
+        return a + b
+
+    with tracer.span("outer"):
+        assert add(1, 2) == 3
+    assert tracer._events == []
+
+
+def test_nested_spans_and_threads(tmp_path):
+    filename = tmp_path / "app.trace.json"
+    tracer = Tracer(batch_size=2)
+    tracer.start(str(filename))
+
+    @tracer.traced("work")
+    def work():
+        pass
+
+    with tracer.span("outer", rows=3):
+        work()
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+    with pytest.raises(KeyError):
+        with tracer.span("failing"):
+            raise KeyError("x")
+    tracer.stop()
+
+    events = {(e["name"], e["args"].get("parent")): e for e in spans(filename)}
+    outer = events[("outer", None)]
+    inner = events[("work", "outer")]
+    threaded = events[("work", None)]
+    assert outer["args"] == {"rows": 3, "depth": 0}
+    assert inner["args"]["depth"] == 1
+    assert inner["tid"] == outer["tid"] != threaded["tid"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert events[("failing", None)]["args"]["error"] == "KeyError"
+    assert not tracer.enabled
+
+
+def test_concurrent_tasks_have_their_own_parents(tmp_path):
+    filename = tmp_path / "app.trace.json"
+    tracer = Tracer()
+    tracer.start(str(filename))
+
+    async def job(i):
+        with tracer.span("job%d" % i):
+            await asyncio.sleep(0.01 * (3 - i))
+            with tracer.span("query%d" % i):
+                await asyncio.sleep(0)
+
+    async def main():
+        with tracer.span("collect"):
+            await asyncio.gather(*[job(i) for i in range(3)])
+
+    asyncio.run(main())
+    tracer.stop()
+
+    events = {e["name"]: e["args"] for e in spans(filename)}
+    for i in range(3):
+        assert events["job%d" % i] == {"parent": "collect", "depth": 1}
+        assert events["query%d" % i] == {"parent": "job%d" % i, "depth": 2}
+    assert events["collect"] == {"depth": 0}
+
+
+def test_requested(monkeypatch):
+    monkeypatch.delenv(Tracer.ENVIRONMENT, raising=False)
+    assert not Tracer.requested([])
+    assert Tracer.requested(["--trace"])
+    monkeypatch.setenv(Tracer.ENVIRONMENT, "1")
+    assert Tracer.requested([])
@@ -0,0 +1,98 @@
+# Copyright © 2019-2025 Andrew Lister
+# License: GNU General Public License v3.0 (see LICENSE file)
+#
+# pytest routines for alx.watch
+
+import os
+import time
+import pytest
+from unittest import mock
+from cryptography.fernet import Fernet
+from alx.app import ALXapp, Paths
+from alx.watch import ConfigWatcher
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    script = tmp_path / "scripts" / "watched" / "watched.py"
+    script.parent.mkdir(parents=True)
+    script.write_text("")
+    (tmp_path / "etc").mkdir()
+    (tmp_path / "etc" / "watched.ini").write_text(
+        "[DEFAULT]\nthreshold = 10\nloglevel = INFO\n\n[dev]\n")
+    monkeypatch.setattr(Paths, "get_module_config_dir",
+                        staticmethod(lambda: str(tmp_path / "config")))
+    monkeypatch.setattr("sys.argv", [str(script)])
+    return ALXapp("Watched")
+
+
+def rewrite(filename, text):
+    with open(filename, "w") as f:
+        f.write(text)
+    # Make sure the modification time moves on coarse file systems
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_no_change(app):
+    assert ConfigWatcher(app).check() == {}
+
+
+def test_reload_updates_values_and_level(app):
+    watcher = ConfigWatcher(app)
+    callback = mock.MagicMock()
+    watcher.add_callback(callback)
+
+    rewrite(app.paths.config, "[DEFAULT]\nthreshold = 20\nloglevel = DEBUG\n\n[dev]\n")
+    with mock.patch.object(app, "set_log_level") as set_log_level:
+        changed = watcher.check()
+
+    assert changed == {"threshold": 20, "loglevel": "DEBUG"}
+    assert app.threshold == 20
+    assert app.config.get("dev", "threshold") == "20"
+    set_log_level.assert_called_once_with("DEBUG")
+    callback.assert_called_once_with(app, changed)
+
+
+def test_bad_callback_does_not_stop_reload(app):
+    watcher = ConfigWatcher(app)
+    watcher.add_callback(mock.MagicMock(side_effect=RuntimeError("boom")))
+
+    rewrite(app.paths.config, "[DEFAULT]\nthreshold = 30\nloglevel = INFO\n\n[dev]\n")
+    assert watcher.check() == {"threshold": 30}
+
+
+def test_watch_config_thread(app):
+    seen = []
+    watcher = app.watch_config(interval=0.01,
+                               callback=lambda a, changed: seen.append(changed))
+    try:
+        rewrite(app.paths.config, "[DEFAULT]\nthreshold = 40\nloglevel = INFO\n\n[dev]\n")
+        deadline = time.time() + 5
+        while not seen and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+
+    assert seen == [{"threshold": 40}]
+    assert app.threshold == 40
+
+
+def test_unchanged_secret_is_not_reported(app, tmp_path):
+    keyfile = tmp_path / "key"
+    keyfile.write_bytes(Fernet.generate_key())
+    keyfile.chmod(0o600)
+    app.paths.keyfile = str(keyfile)
+    token = app.encrypt("hunter2")
+    watcher = ConfigWatcher(app)
+
+    rewrite(app.paths.config, "[DEFAULT]\nthreshold = 10\nloglevel = INFO\n"
+                              "password = enc:%s\n\n[dev]\n" % token)
+    assert list(watcher.check()) == ["password"]
+    assert app.password == "hunter2"
+
+    rewrite(app.paths.config, "[DEFAULT]\nthreshold = 2\nloglevel = INFO\n"
+                              "password = enc:%s\n\n[dev]\n" % token)
+    assert watcher.check() == {"threshold": 2}
+    # Still decrypted
+    assert app.__dict__["password"] == "hunter2"